@@ -1,9 +1,26 @@
 from fastapi import FastAPI, Request, Response
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import asyncio, time
+import importlib.util
 import json
 import logging
-from src.mcp_server_fetch.server import fetch_url, Fetch, check_may_autonomously_fetch_url
+import os
+import uuid
+from src.mcp_server_fetch.admission import SERVER_BUSY, AdmissionController, ServerBusy
+from src.mcp_server_fetch.client import ClientPool, HttpSettings
+from src.mcp_server_fetch.diagnostics import Diagnostics, DiagnosticsSettings, stage
+from src.mcp_server_fetch.document import DEFAULT_STRIP_QUERY_PARAMS, DocumentCache
+from src.mcp_server_fetch.inflight import InflightRegistry, RequestCancelled
+from src.mcp_server_fetch.metrics import metrics
+from src.mcp_server_fetch.prefetch import Prefetcher, PrefetchSettings
+from src.mcp_server_fetch.server import (
+    fetch_document,
+    format_window,
+    search_document,
+    Fetch,
+    FetchSearch,
+)
+from mcp.shared.exceptions import McpError
 from mcp.types import TextContent
 from pydantic import ValidationError
 
@@ -13,13 +30,104 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Converted documents shared across tool calls, so section jumps and pagination don't refetch
+strip_query_params = os.environ.get("FETCH_MCP_STRIP_QUERY_PARAMS")
+documents = DocumentCache(
+    max_entries=int(os.environ.get("FETCH_MCP_CACHE_SIZE", "128")),
+    strip_query_params=(
+        [param.strip() for param in strip_query_params.split(",") if param.strip()]
+        if strip_query_params is not None
+        else DEFAULT_STRIP_QUERY_PARAMS
+    ),
+)
+
+# Timeouts, retries and hedging for upstream requests
+hedge_after = os.environ.get("FETCH_MCP_HEDGE_AFTER")
+if os.environ.get("FETCH_MCP_HTTP2", "") == "1" and importlib.util.find_spec("h2") is None:
+    # Fail at startup, as the CLI does, rather than on every tool call
+    raise RuntimeError("FETCH_MCP_HTTP2=1 needs the h2 package, install mcp-server-fetch[http2]")
+http_settings = HttpSettings(
+    connect_timeout=float(os.environ.get("FETCH_MCP_CONNECT_TIMEOUT", "10")),
+    read_timeout=float(os.environ.get("FETCH_MCP_READ_TIMEOUT", "30")),
+    write_timeout=float(os.environ.get("FETCH_MCP_WRITE_TIMEOUT", "10")),
+    pool_timeout=float(os.environ.get("FETCH_MCP_POOL_TIMEOUT", "10")),
+    deadline=float(os.environ.get("FETCH_MCP_DEADLINE", "60")),
+    retries=int(os.environ.get("FETCH_MCP_RETRIES", "2")),
+    hedge=os.environ.get("FETCH_MCP_HEDGE", "") == "1",
+    hedge_after=float(hedge_after) if hedge_after else None,
+    http2=os.environ.get("FETCH_MCP_HTTP2", "") == "1",
+    dns_cache_ttl=float(os.environ.get("FETCH_MCP_DNS_CACHE_TTL", "60")),
+)
+
+# Upstream clients shared across tool calls, so connections (and HTTP/2 streams) are reused
+clients = ClientPool(http_settings)
+
+# Optionally warm the cache with same-origin links from fetched pages
+prefetcher = Prefetcher(
+    PrefetchSettings(
+        links=int(os.environ.get("FETCH_MCP_PREFETCH_LINKS", "0")),
+        max_concurrent=int(os.environ.get("FETCH_MCP_PREFETCH_CONCURRENCY", "2")),
+        max_bytes_per_minute=int(os.environ.get("FETCH_MCP_PREFETCH_BYTES_PER_MINUTE", "5000000")),
+        host_interval=float(os.environ.get("FETCH_MCP_PREFETCH_HOST_INTERVAL", "2")),
+    ),
+    documents,
+    lambda link, compact: fetch_document(
+        link,
+        "ModelContextProtocol/1.0 (Autonomous; +https://github.com/modelcontextprotocol/servers)",
+        cache=documents,
+        check_robots=True,
+        settings=http_settings,
+        clients=clients,
+        compact=compact,
+    ),
+)
+
+# Opt-in diagnostics; the /debug endpoints only exist when FETCH_MCP_DEBUG_ENDPOINTS=1
+slow_call_ms = os.environ.get("FETCH_MCP_SLOW_CALL_MS")
+debug_endpoints = os.environ.get("FETCH_MCP_DEBUG_ENDPOINTS", "") == "1"
+diagnostics = Diagnostics(DiagnosticsSettings(
+    slow_call_ms=float(slow_call_ms) if slow_call_ms else None,
+    tracemalloc_interval=float(os.environ.get("FETCH_MCP_TRACEMALLOC_INTERVAL", "0")),
+    tracemalloc_top=int(os.environ.get("FETCH_MCP_TRACEMALLOC_TOP", "15")),
+    profiling=debug_endpoints,
+))
+
+@app.on_event("startup")
+async def start_diagnostics():
+    diagnostics.start()
+
+@app.on_event("shutdown")
+async def close_clients():
+    await diagnostics.aclose()
+    await prefetcher.aclose()
+    await clients.aclose()
+
+# Tool calls in progress, keyed by session and JSON-RPC id, so notifications/cancelled can abort them
+inflight = InflightRegistry()
+
+def session_key(request: Request) -> str:
+    """Identify the client a request came from; each client numbers its JSON-RPC ids independently"""
+    session_id = request.headers.get("mcp-session-id")
+    if session_id:
+        return session_id
+    # Clients that don't echo the session id are told apart by address
+    return request.client.host if request.client else ""
+
+# Limit concurrent tool calls and shed load once the wait queue is full
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get("FETCH_MCP_MAX_CONCURRENT", "16")),
+    max_queue=int(os.environ.get("FETCH_MCP_MAX_QUEUE", "64")),
+    queue_timeout=float(os.environ.get("FETCH_MCP_QUEUE_TIMEOUT", "10")),
+)
+
 # Allow browser-based clients (Claude settings panel) to access SSE
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["GET", "POST"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["Mcp-Session-Id", "Retry-After"]
 )
 
 async def event_stream():
@@ -96,6 +204,28 @@ async def root():
 async def favicon():
     return Response(status_code=204)
 
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0):
+    """cProfile the event loop for a few seconds and return the busiest functions"""
+    if not debug_endpoints:
+        return Response(status_code=404)
+    try:
+        report = await diagnostics.profile(min(seconds, 60.0))
+    except RuntimeError as e:
+        return Response(str(e), status_code=409, media_type="text/plain")
+    return Response(report, media_type="text/plain")
+
+@app.get("/debug/tracemalloc")
+async def debug_tracemalloc(top: int = 25):
+    """Report the top memory allocation sites (needs FETCH_MCP_TRACEMALLOC_INTERVAL to be set)"""
+    if not debug_endpoints:
+        return Response(status_code=404)
+    return Response(diagnostics.tracemalloc_report(top), media_type="text/plain")
+
 # MCP Protocol endpoints
 @app.get("/mcp")
 async def mcp_sse():
@@ -168,7 +298,8 @@ async def handle_mcp(request: Request):
                 }
             }
             logger.info(f"Initialize Response: {json.dumps(response, indent=2)}")
-            return response
+            # Clients send the session id back on later requests, which keeps their request ids apart
+            return JSONResponse(response, headers={"Mcp-Session-Id": uuid.uuid4().hex})
         
         elif method == "notifications/initialized":
             # Claude sends this after successful initialization - no response needed
@@ -176,8 +307,12 @@ async def handle_mcp(request: Request):
             return Response(status_code=204)
         
         elif method == "notifications/cancelled":
-            # Claude sends timeout notifications that we should acknowledge - no response needed
-            logger.info("Received notifications/cancelled - no response needed")
+            # Claude sends timeout notifications - abort the matching tool call if it is still running
+            cancelled_id = params.get("requestId")
+            if inflight.cancel((session_key(request), cancelled_id)):
+                logger.info(f"Received notifications/cancelled - cancelled in-flight request {cancelled_id}")
+            else:
+                logger.info(f"Received notifications/cancelled - request {cancelled_id} is not in flight")
             return Response(status_code=204)
         
         elif method == "resources/list":
@@ -220,14 +355,78 @@ async def handle_mcp(request: Request):
                                         "default": 5000,
                                         "description": "Maximum number of characters to return"
                                     },
+                                    "start_index": {
+                                        "type": "integer",
+                                        "default": 0,
+                                        "description": "Start content from this character index"
+                                    },
                                     "raw": {
                                         "type": "boolean", 
                                         "default": False,
                                         "description": "Return raw HTML instead of markdown"
+                                    },
+                                    "section": {
+                                        "type": "string",
+                                        "description": "Return only the section under the matching heading from the table of contents"
+                                    },
+                                    "chunk_id": {
+                                        "type": "integer",
+                                        "description": "Return only the chunk with this id from the table of contents"
+                                    },
+                                    "compact": {
+                                        "type": "string",
+                                        "enum": ["none", "footnotes", "text"],
+                                        "default": "none",
+                                        "description": "Shrink the markdown: 'footnotes' moves link URLs to numbered references at the end, 'text' drops link URLs; both remove images, blank lines and navigation link lists"
                                     }
                                 },
                                 "required": ["url"]
                             }
+                        },
+                        {
+                            "name": "fetch_search",
+                            "title": "Search URL",
+                            "description": "Search the content of a URL for a substring or regex and return matching snippets with their start_index offsets",
+                            "annotations": {
+                                "title": "Search URL",
+                                "readOnlyHint": True,
+                                "openWorldHint": True
+                            },
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "url": {
+                                        "type": "string",
+                                        "description": "The URL to search"
+                                    },
+                                    "query": {
+                                        "type": "string",
+                                        "description": "Case-insensitive substring to look for, or a regex if regex is true"
+                                    },
+                                    "regex": {
+                                        "type": "boolean",
+                                        "default": False,
+                                        "description": "Treat the query as a regular expression"
+                                    },
+                                    "max_results": {
+                                        "type": "integer",
+                                        "default": 10,
+                                        "description": "Maximum number of matches to return"
+                                    },
+                                    "context": {
+                                        "type": "integer",
+                                        "default": 200,
+                                        "description": "Characters of surrounding text to return on each side of a match"
+                                    },
+                                    "compact": {
+                                        "type": "string",
+                                        "enum": ["none", "footnotes", "text"],
+                                        "default": "none",
+                                        "description": "Search the page as compacted by fetch with this setting, so start_index offsets apply to fetch calls with the same compact value"
+                                    }
+                                },
+                                "required": ["url", "query"]
+                            }
                         }
                     ]
                 }
@@ -240,72 +439,101 @@ async def handle_mcp(request: Request):
             tool_name = params.get("name")
             arguments = params.get("arguments", {})
             
-            if tool_name != "fetch":
+            if tool_name not in ("fetch", "fetch_search"):
                 return {
                     "jsonrpc": "2.0",
                     "id": request_id,
                     "error": {"code": -32601, "message": "Method not found"}
                 }
             
-            try:
-                # Parse and validate arguments
-                args = Fetch(**arguments)
-                url = str(args.url)
-                
-                # Check robots.txt
-                await check_may_autonomously_fetch_url(
-                    url, 
-                    "ModelContextProtocol/1.0 (Autonomous; +https://github.com/modelcontextprotocol/servers)"
-                )
+            # Time each stage of the call, for the slow-call log
+            with diagnostics.track_call(tool_name, str(arguments.get("url"))) as profile:
+                try:
+                    # Parse and validate arguments
+                    args = (FetchSearch if tool_name == "fetch_search" else Fetch)(**arguments)
+                    url = str(args.url)
                 
-                # Fetch the URL
-                content, prefix = await fetch_url(
-                    url, 
-                    "ModelContextProtocol/1.0 (Autonomous; +https://github.com/modelcontextprotocol/servers)",
-                    force_raw=args.raw
-                )
+                    async def call() -> str:
+                        # Fetch the URL (robots.txt is checked on cache misses)
+                        document = await fetch_document(
+                            url,
+                            "ModelContextProtocol/1.0 (Autonomous; +https://github.com/modelcontextprotocol/servers)",
+                            force_raw=args.raw,
+                            cache=documents,
+                            check_robots=True,
+                            settings=http_settings,
+                            clients=clients,
+                            compact=args.compact,
+                        )
+                        if tool_name == "fetch_search":
+                            # Search the cached text instead of paging through it
+                            content = await search_document(document, args)
+                            return f"Matches for {args.query!r} in {url}:\n{content}"
+                        # Handle pagination and section selection
+                        with stage("slice"):
+                            content = format_window(document, args)
+                        if args.start_index == 0 and args.section is None and args.chunk_id is None:
+                            prefetcher.after_fetch(url, document, args.compact)
+                        return f"{document.prefix}Contents of {url}:\n{content}"
+
+                    # The whole call is admitted and tracked, so the concurrency limit and
+                    # cancellation cover searching and slicing as well as the fetch
+                    text = await inflight.run((session_key(request), request_id), admission.run(call()))
+                    if profile is not None:
+                        profile.output_size = len(text)
                 
-                # Handle pagination
-                original_length = len(content)
-                if args.start_index >= original_length:
-                    content = "<error>No more content available.</error>"
-                else:
-                    truncated_content = content[args.start_index : args.start_index + args.max_length]
-                    if not truncated_content:
-                        content = "<error>No more content available.</error>"
-                    else:
-                        content = truncated_content
-                        actual_content_length = len(truncated_content)
-                        remaining_content = original_length - (args.start_index + actual_content_length)
-                        if actual_content_length == args.max_length and remaining_content > 0:
-                            next_start = args.start_index + actual_content_length
-                            content += f"\n\n<error>Content truncated. Call the fetch tool with a start_index of {next_start} to get more content.</error>"
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "result": {
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": text
+                                }
+                            ]
+                        }
+                    }
                 
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"{prefix}Contents of {url}:\n{content}"
+                except ValidationError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {"code": -32602, "message": f"Invalid params: {str(e)}"}
+                    }
+                except ServerBusy as e:
+                    logger.warning(f"Shedding tools/call (ID {request_id}): {e}")
+                    return JSONResponse(
+                        {
+                            "jsonrpc": "2.0",
+                            "id": request_id,
+                            "error": {
+                                "code": SERVER_BUSY,
+                                "message": str(e),
+                                "data": {"retryAfter": e.retry_after}
                             }
-                        ]
+                        },
+                        headers={"Retry-After": str(e.retry_after)}
+                    )
+                except RequestCancelled as e:
+                    logger.info(str(e))
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {"code": -32603, "message": str(e)}
+                    }
+                except McpError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {"code": e.error.code, "message": e.error.message}
+                    }
+                except Exception as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {"code": -32603, "message": f"Internal error: {str(e)}"}
                     }
-                }
-                
-            except ValidationError as e:
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {"code": -32602, "message": f"Invalid params: {str(e)}"}
-                }
-            except Exception as e:
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {"code": -32603, "message": f"Internal error: {str(e)}"}
-                }
         
         else:
             error_response = {
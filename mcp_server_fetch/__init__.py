@@ -1,3 +1,7 @@
+from .client import HttpSettings
+from .diagnostics import DiagnosticsSettings
+from .document import DEFAULT_STRIP_QUERY_PARAMS
+from .prefetch import PrefetchSettings
 from .server import serve
 
 
@@ -5,6 +9,7 @@ def main():
     """MCP Fetch Server - HTTP fetching functionality for MCP"""
     import argparse
     import asyncio
+    import importlib.util
 
     parser = argparse.ArgumentParser(
         description="give a model the ability to make web requests"
@@ -16,9 +21,180 @@ def main():
         help="Ignore robots.txt restrictions",
     )
     parser.add_argument("--proxy-url", type=str, help="Proxy URL to use for requests")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=128,
+        help="Maximum number of URLs to keep converted documents for in memory (0 disables caching)",
+    )
+    parser.add_argument(
+        "--strip-query-param",
+        action="append",
+        metavar="PATTERN",
+        help="Query parameter ignored when matching URLs against the cache, e.g. 'utm_*' "
+        "(may be repeated; replaces the default list of tracking parameters)",
+    )
+    parser.add_argument(
+        "--connect-timeout", type=float, default=10.0, help="Seconds to wait for a connection to an upstream host"
+    )
+    parser.add_argument(
+        "--read-timeout", type=float, default=30.0, help="Seconds to wait between bytes of an upstream response"
+    )
+    parser.add_argument(
+        "--write-timeout", type=float, default=10.0, help="Seconds to wait while sending a request upstream"
+    )
+    parser.add_argument(
+        "--pool-timeout",
+        type=float,
+        default=10.0,
+        help="Seconds to wait for a free connection to an upstream host",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=60.0,
+        help="Overall seconds a tool call may spend on upstream requests, including robots.txt and retries",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Times to retry a request after a connection error or a 429/502/503/504 status",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a second request when the first is slower than --hedge-after (or the observed p95 latency)",
+    )
+    parser.add_argument(
+        "--hedge-after", type=float, help="Seconds to wait before sending a hedged request"
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Use HTTP/2 for upstream requests where supported (install mcp-server-fetch[http2])",
+    )
+    parser.add_argument(
+        "--dns-cache-ttl",
+        type=float,
+        default=60.0,
+        help="Longest time in seconds to cache DNS answers for upstream hosts in process; shorter record TTLs are honoured (0 to resolve every connection)",
+    )
+    parser.add_argument(
+        "--max-concurrent",
+        type=int,
+        default=16,
+        help="Maximum number of tool calls to run at once (0 for no limit)",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=64,
+        help="Maximum number of tool calls waiting for a slot before new calls are rejected as busy",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=10.0,
+        help="Seconds a tool call may wait for a slot before it is rejected as busy",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=0.0,
+        help="Log the server's counters, such as admission_queue_depth and admission_shed, every this many seconds",
+    )
+    parser.add_argument(
+        "--prefetch-links",
+        type=int,
+        default=0,
+        help="Number of same-origin links to prefetch in the background from each fetched page (0 disables)",
+    )
+    parser.add_argument(
+        "--prefetch-concurrency",
+        type=int,
+        default=2,
+        help="Maximum number of pages whose links are being prefetched at once",
+    )
+    parser.add_argument(
+        "--prefetch-bytes-per-minute",
+        type=int,
+        default=5_000_000,
+        help="Maximum bytes the prefetcher may download per minute",
+    )
+    parser.add_argument(
+        "--prefetch-host-interval",
+        type=float,
+        default=2.0,
+        help="Minimum seconds between prefetches from the same host",
+    )
+    parser.add_argument(
+        "--slow-call-ms",
+        type=float,
+        help="Log tool calls slower than this, with time spent per stage and input size",
+    )
+    parser.add_argument(
+        "--tracemalloc-interval",
+        type=float,
+        default=0.0,
+        help="Log the top memory allocation sites every this many seconds (0 disables tracemalloc)",
+    )
+    parser.add_argument(
+        "--tracemalloc-top",
+        type=int,
+        default=15,
+        help="Number of allocation sites in each tracemalloc report",
+    )
+    parser.add_argument(
+        "--enable-profiling",
+        action="store_true",
+        help="Write a cProfile report of the next 10 seconds to a temporary file on SIGUSR1",
+    )
 
     args = parser.parse_args()
-    asyncio.run(serve(args.user_agent, args.ignore_robots_txt, args.proxy_url))
+    if args.http2 and importlib.util.find_spec("h2") is None:
+        parser.error("--http2 needs the h2 package, install mcp-server-fetch[http2]")
+    asyncio.run(
+        serve(
+            args.user_agent,
+            args.ignore_robots_txt,
+            args.proxy_url,
+            cache_size=args.cache_size,
+            strip_query_params=(
+                args.strip_query_param
+                if args.strip_query_param is not None
+                else DEFAULT_STRIP_QUERY_PARAMS
+            ),
+            http_settings=HttpSettings(
+                connect_timeout=args.connect_timeout,
+                read_timeout=args.read_timeout,
+                write_timeout=args.write_timeout,
+                pool_timeout=args.pool_timeout,
+                deadline=args.deadline,
+                retries=args.retries,
+                hedge=args.hedge,
+                hedge_after=args.hedge_after,
+                http2=args.http2,
+                dns_cache_ttl=args.dns_cache_ttl,
+            ),
+            max_concurrent=args.max_concurrent,
+            max_queue=args.max_queue,
+            queue_timeout=args.queue_timeout,
+            prefetch_settings=PrefetchSettings(
+                links=args.prefetch_links,
+                max_concurrent=args.prefetch_concurrency,
+                max_bytes_per_minute=args.prefetch_bytes_per_minute,
+                host_interval=args.prefetch_host_interval,
+            ),
+            diagnostics_settings=DiagnosticsSettings(
+                slow_call_ms=args.slow_call_ms,
+                tracemalloc_interval=args.tracemalloc_interval,
+                tracemalloc_top=args.tracemalloc_top,
+                profiling=args.enable_profiling,
+                metrics_interval=args.metrics_interval,
+            ),
+        )
+    )
 
 
 if __name__ == "__main__":
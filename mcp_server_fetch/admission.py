@@ -0,0 +1,91 @@
+import asyncio
+import math
+import time
+from typing import Coroutine, TypeVar
+
+from .diagnostics import stage
+from .metrics import metrics
+
+T = TypeVar("T")
+
+# Implementation-defined JSON-RPC server error used when a call is shed
+SERVER_BUSY = -32000
+
+
+class ServerBusy(Exception):
+    """Raised when a tool call is rejected because the server is saturated."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Limits concurrent tool calls, with a bounded wait queue and a queue-time deadline.
+
+    A call that finds the queue full, or waits longer than `queue_timeout`,
+    is rejected with ServerBusy instead of piling more work onto an
+    overloaded server.
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 64, queue_timeout: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max(max_concurrent, 1))
+        self._active = 0
+        self._waiting = 0
+        # Moving average of how long an admitted call holds its slot, for the retry-after hint
+        self._service_time = 1.0
+        metrics.gauge("admission_active", lambda: self._active)
+        metrics.gauge("admission_queue_depth", lambda: self._waiting)
+
+    def retry_after(self) -> int:
+        """Estimate how many seconds it will take for the current backlog to drain."""
+        backlog = self._waiting + self._active + 1
+        return max(1, math.ceil(self._service_time * backlog / max(self.max_concurrent, 1)))
+
+    def _shed(self, reason: str) -> ServerBusy:
+        metrics.increment("admission_shed")
+        metrics.increment(f"admission_shed_{reason}")
+        return ServerBusy(self.retry_after())
+
+    async def run(self, work: Coroutine[object, object, T]) -> T:
+        """Run a tool call once a slot is free.
+
+        Raises:
+            ServerBusy: If the queue is full or no slot became free within the queue timeout
+        """
+        if self.max_concurrent <= 0:
+            return await work
+
+        if self._slots.locked():
+            if self._waiting >= self.max_queue:
+                work.close()
+                raise self._shed("queue_full")
+            self._waiting += 1
+            queued_at = time.monotonic()
+            try:
+                with stage("queue"):
+                    await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                work.close()
+                raise self._shed("queue_timeout")
+            except BaseException:
+                work.close()
+                raise
+            finally:
+                self._waiting -= 1
+            metrics.increment("admission_queued")
+            metrics.increment("admission_queue_ms", int((time.monotonic() - queued_at) * 1000))
+        else:
+            await self._slots.acquire()
+
+        self._active += 1
+        started = time.monotonic()
+        try:
+            return await work
+        finally:
+            self._active -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - started)
+            self._slots.release()
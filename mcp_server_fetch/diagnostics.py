@@ -0,0 +1,223 @@
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TypeVar
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class CallProfile:
+    """Where the time went in a single tool call."""
+
+    tool: str
+    url: str
+    started: float = field(default_factory=time.monotonic)
+    stages: dict[str, float] = field(default_factory=dict)
+    input_size: int = 0
+    output_size: int = 0
+    # When the call returned or was cancelled; worker threads it started may still be running
+    finished: float | None = None
+
+    def describe(self) -> str:
+        elapsed = (time.monotonic() - self.started) * 1000
+        stages = " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items())
+        return (
+            f"{self.tool} {self.url} took {elapsed:.0f}ms "
+            f"(input {self.input_size} chars, output {self.output_size} chars; {stages or 'no stages'})"
+        )
+
+
+_current_call: ContextVar[CallProfile | None] = ContextVar("current_call", default=None)
+
+
+def current_call() -> CallProfile | None:
+    """The profile of the tool call being handled, if diagnostics are collecting one."""
+    return _current_call.get()
+
+
+def detach_call() -> None:
+    """Stop attributing work in the current task to the tool call that spawned it."""
+    _current_call.set(None)
+
+
+# Profilers of worker threads, collected while Diagnostics.profile is running
+_worker_profilers: list[cProfile.Profile] | None = None
+
+
+def _run_in_worker(func: Callable[..., T], *args: Any) -> T:
+    profilers = _worker_profilers
+    profiler = None
+    if profilers is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the one profiler already running
+            profiler = None
+    started = time.monotonic()
+    try:
+        return func(*args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profilers.append(profiler)
+        profile = _current_call.get()
+        if profile is not None and profile.finished is not None:
+            # The slow-call log was written without this work, so report it from here
+            logger.warning(
+                f"Worker {getattr(func, '__name__', func)} outlived its call by "
+                f"{(time.monotonic() - profile.finished) * 1000:.0f}ms after running "
+                f"{(time.monotonic() - started) * 1000:.0f}ms: {profile.describe()}"
+            )
+
+
+async def to_thread(func: Callable[..., T], *args: Any) -> T:
+    """Run a function in a worker thread, like asyncio.to_thread.
+
+    Stages the function times are attributed to the current tool call, the
+    thread is included in any cProfile dump being taken, and work that
+    outlives its call (because the call was cancelled or timed out) is
+    logged with the call's stage costs when it finishes.
+    """
+    return await asyncio.to_thread(_run_in_worker, func, *args)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current tool call; a no-op when no call is being profiled.
+
+    The profile is held in a context variable, so stages run in worker
+    threads started with to_thread are attributed to the call too.
+    """
+    profile = _current_call.get()
+    if profile is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        profile.stages[name] = profile.stages.get(name, 0.0) + time.monotonic() - started
+
+
+@dataclass(frozen=True)
+class DiagnosticsSettings:
+    """Opt-in diagnostics for triaging memory and CPU spikes."""
+
+    # Log tool calls slower than this many milliseconds, with their per-stage breakdown
+    slow_call_ms: float | None = None
+    # Log the top allocation sites every this many seconds (0 disables tracemalloc)
+    tracemalloc_interval: float = 0.0
+    tracemalloc_top: int = 15
+    # Log a snapshot of the server's counters and gauges every this many seconds (0 disables)
+    metrics_interval: float = 0.0
+    # Allow on-demand cProfile dumps
+    profiling: bool = False
+
+
+class Diagnostics:
+    """Slow-call logging, periodic tracemalloc reports and on-demand cProfile dumps."""
+
+    def __init__(self, settings: DiagnosticsSettings = DiagnosticsSettings()):
+        self.settings = settings
+        self._reporters: list[asyncio.Task] = []
+        self._profile_lock = asyncio.Lock()
+
+    @contextmanager
+    def track_call(self, tool: str, url: str) -> Iterator[CallProfile | None]:
+        """Profile a tool call, logging it if it was slow. Yields None when slow-call logging is off."""
+        if self.settings.slow_call_ms is None:
+            yield None
+            return
+        profile = CallProfile(tool=tool, url=url)
+        token = _current_call.set(profile)
+        try:
+            yield profile
+        finally:
+            _current_call.reset(token)
+            profile.finished = time.monotonic()
+            if (profile.finished - profile.started) * 1000 >= self.settings.slow_call_ms:
+                metrics.increment("slow_calls")
+                logger.warning(f"Slow call: {profile.describe()}")
+
+    def start(self) -> None:
+        """Start the periodic tracemalloc and metrics reporters, if enabled."""
+        if self._reporters:
+            return
+        if self.settings.tracemalloc_interval > 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            self._reporters.append(asyncio.ensure_future(self._report_allocations()))
+        if self.settings.metrics_interval > 0:
+            self._reporters.append(asyncio.ensure_future(self._report_metrics()))
+
+    async def _report_allocations(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.tracemalloc_interval)
+            logger.warning(f"Top allocations:\n{self.tracemalloc_report()}")
+
+    async def _report_metrics(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.metrics_interval)
+            logger.warning(f"Metrics: {json.dumps(metrics.snapshot(), sort_keys=True)}")
+
+    def tracemalloc_report(self, top: int | None = None) -> str:
+        """Return the current and peak traced memory and the top allocation sites by size."""
+        if not tracemalloc.is_tracing():
+            return "tracemalloc is not running"
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics("lineno")
+        lines = [f"traced memory: current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB"]
+        lines.extend(str(statistic) for statistic in statistics[: top or self.settings.tracemalloc_top])
+        return "\n".join(lines)
+
+    async def profile(self, seconds: float, top: int = 50) -> str:
+        """Profile the server with cProfile for `seconds` and return the busiest functions.
+
+        Work started with to_thread during the profile, such as HTML
+        extraction, is profiled in its worker thread and merged into the
+        report.
+
+        Raises:
+            RuntimeError: If profiling is not enabled, or a profile is already being taken
+        """
+        if not self.settings.profiling:
+            raise RuntimeError("Profiling is not enabled")
+        if self._profile_lock.locked():
+            raise RuntimeError("A profile is already being taken")
+        global _worker_profilers
+        async with self._profile_lock:
+            profiler = cProfile.Profile()
+            workers: list[cProfile.Profile] = []
+            profiler.enable()
+            _worker_profilers = workers
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                _worker_profilers = None
+                profiler.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        for worker in workers:
+            stats.add(worker)
+        stats.sort_stats("cumulative").print_stats(top)
+        return output.getvalue()
+
+    async def aclose(self) -> None:
+        reporters, self._reporters = self._reporters, []
+        for reporter in reporters:
+            reporter.cancel()
+        await asyncio.gather(*reporters, return_exceptions=True)
@@ -0,0 +1,26 @@
+from collections import Counter
+from typing import Callable
+
+
+class Metrics:
+    """Process-wide counters, plus gauges that are read when a snapshot is taken."""
+
+    def __init__(self):
+        self.counters: Counter[str] = Counter()
+        self._gauges: dict[str, Callable[[], float]] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def gauge(self, name: str, read: Callable[[], float]) -> None:
+        """Register a function returning the current value of `name`."""
+        self._gauges[name] = read
+
+    def snapshot(self) -> dict[str, float]:
+        values: dict[str, float] = dict(self.counters)
+        for name, read in self._gauges.items():
+            values[name] = read()
+        return values
+
+
+metrics = Metrics()
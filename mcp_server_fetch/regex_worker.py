@@ -0,0 +1,56 @@
+import asyncio
+import json
+import sys
+
+# Seconds a regular expression search may run before its worker process is killed
+REGEX_TIMEOUT = 5.0
+
+# Run with -I, so the worker imports nothing but the standard library
+_WORKER = """
+import json, re, sys
+pattern, max_results = json.loads(sys.stdin.buffer.readline())
+content = sys.stdin.buffer.read().decode("utf-8", "surrogatepass")
+spans = []
+for match in re.finditer(pattern, content, re.IGNORECASE | re.MULTILINE):
+    if match.end() > match.start():
+        spans.append(match.span())
+        if len(spans) >= max_results:
+            break
+json.dump(spans, sys.stdout)
+"""
+
+
+class RegexTimeout(Exception):
+    """A regular expression search ran past its time limit and was stopped."""
+
+
+async def regex_spans(
+    content: str, pattern: str, max_results: int, timeout: float = REGEX_TIMEOUT
+) -> list[tuple[int, int]]:
+    """Find the spans of non-empty, case-insensitive matches of a pattern in a worker process.
+
+    The re module holds the GIL while it backtracks, so a slow pattern run in
+    a thread would stall the event loop as well. A process can be killed
+    instead, once `timeout` seconds have passed or the call is cancelled.
+
+    Raises:
+        RegexTimeout: If the search didn't finish within `timeout` seconds
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-I", "-c", _WORKER,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    request = json.dumps([pattern, max_results]).encode() + b"\n" + content.encode("utf-8", "surrogatepass")
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(request), timeout)
+    except asyncio.TimeoutError:
+        raise RegexTimeout(f"the search took longer than {timeout:g} seconds")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"regular expression worker exited with status {process.returncode}")
+    return [(start, end) for start, end in json.loads(stdout)]
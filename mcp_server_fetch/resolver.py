@@ -0,0 +1,363 @@
+import asyncio
+import ipaddress
+import random
+import socket
+import struct
+import time
+from collections import OrderedDict
+from typing import Iterable, Protocol
+
+import httpcore
+
+from .metrics import metrics
+
+
+class Resolver(Protocol):
+    """Resolves a host name to the addresses to try connecting to, in order of preference."""
+
+    async def resolve(self, host: str, port: int) -> list[tuple[int, str]]:
+        """Return (address family, address) pairs for `host`.
+
+        Raises:
+            socket.gaierror: If the name cannot be resolved
+        """
+        ...
+
+
+class SystemResolver:
+    """Resolves names with the system resolver, via the event loop's getaddrinfo."""
+
+    async def resolve(self, host: str, port: int) -> list[tuple[int, str]]:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )
+        addresses = []
+        for family, _, _, _, sockaddr in infos:
+            address = (family, sockaddr[0])
+            if address not in addresses:
+                addresses.append(address)
+        return addresses
+
+
+# DNS record types and response codes used by DnsResolver
+_TYPE_A = 1
+_TYPE_AAAA = 28
+_RCODE_NXDOMAIN = 3
+
+
+def _read_nameservers(path: str = "/etc/resolv.conf") -> list[tuple[str, int]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    return [(line.split()[1], 53) for line in lines if line.startswith("nameserver") and len(line.split()) > 1]
+
+
+def _read_hosts(path: str = "/etc/hosts") -> set[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return set()
+    names = set()
+    for line in lines:
+        names.update(name.lower() for name in line.split("#", 1)[0].split()[1:])
+    return names
+
+
+def _encode_query(query_id: int, host: str, record_type: int) -> bytes:
+    question = b"".join(bytes([len(label)]) + label for label in host.encode("idna").split(b"."))
+    return struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + question + b"\0" + struct.pack("!HH", record_type, 1)
+
+
+def _skip_name(message: bytes, offset: int) -> int:
+    while True:
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+        if length == 0:
+            return offset
+
+
+def _decode_answers(message: bytes, query_id: int) -> tuple[int, bool, list[tuple[int, str]], int | None]:
+    """Return the response code, whether the response was truncated, its A/AAAA records and their TTL.
+
+    The TTL is the lowest of all answer records, CNAMEs included, or None if there were none.
+    """
+    response_id, flags, questions, answers = struct.unpack_from("!HHHH", message)
+    if response_id != query_id or not flags & 0x8000:
+        raise ValueError("not a response to this query")
+    offset = 12
+    for _ in range(questions):
+        offset = _skip_name(message, offset) + 4
+    addresses = []
+    lowest_ttl = None
+    for _ in range(answers):
+        offset = _skip_name(message, offset)
+        record_type, _, ttl, length = struct.unpack_from("!HHIH", message, offset)
+        lowest_ttl = ttl if lowest_ttl is None else min(lowest_ttl, ttl)
+        offset += 10
+        data = message[offset : offset + length]
+        if record_type == _TYPE_A and length == 4:
+            addresses.append((socket.AF_INET, socket.inet_ntop(socket.AF_INET, data)))
+        elif record_type == _TYPE_AAAA and length == 16:
+            addresses.append((socket.AF_INET6, socket.inet_ntop(socket.AF_INET6, data)))
+        offset += length
+    return flags & 0xF, bool(flags & 0x0200), addresses, lowest_ttl
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id: int):
+        self.query_id = query_id
+        self.answer: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if self.answer.done():
+            return
+        try:
+            self.answer.set_result(_decode_answers(data, self.query_id))
+        except (ValueError, IndexError, struct.error):
+            # Ignore stray or malformed datagrams and keep waiting for the real answer
+            pass
+
+    def error_received(self, exc: Exception) -> None:
+        if not self.answer.done():
+            self.answer.set_exception(exc)
+
+
+class DnsResolver:
+    """Resolves names by querying DNS servers directly over UDP, without blocking a thread.
+
+    A and AAAA queries are sent concurrently to the nameservers from
+    /etc/resolv.conf, one server at a time. Names the DNS can't answer for
+    (single-label names, names in /etc/hosts), truncated answers and
+    unreachable servers are handed to `fallback`, the system resolver by
+    default, so behaviour matches getaddrinfo where it matters.
+    """
+
+    def __init__(
+        self,
+        nameservers: list[tuple[str, int]] | None = None,
+        timeout: float = 2.0,
+        fallback: Resolver | None = None,
+        hosts: set[str] | None = None,
+    ):
+        self.nameservers = nameservers if nameservers is not None else _read_nameservers()
+        self.timeout = timeout
+        self.fallback = fallback or SystemResolver()
+        self.hosts = hosts if hosts is not None else _read_hosts()
+
+    async def resolve(self, host: str, port: int) -> list[tuple[int, str]]:
+        addresses, _ = await self.resolve_with_ttl(host, port)
+        return addresses
+
+    async def resolve_with_ttl(self, host: str, port: int) -> tuple[list[tuple[int, str]], int | None]:
+        """Like `resolve`, but also return the records' TTL in seconds, or None if the fallback answered."""
+        name = host.lower().rstrip(".")
+        if not self.nameservers or "." not in name or name in self.hosts:
+            return await self.fallback.resolve(host, port), None
+        for nameserver in self.nameservers:
+            try:
+                answers = await asyncio.gather(
+                    self._query(nameserver, name, _TYPE_AAAA), self._query(nameserver, name, _TYPE_A)
+                )
+            except (OSError, UnicodeError, asyncio.TimeoutError):
+                continue
+            if any(truncated for _, truncated, _, _ in answers):
+                break
+            if any(rcode == _RCODE_NXDOMAIN for rcode, _, _, _ in answers):
+                raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+            if all(rcode == 0 for rcode, _, _, _ in answers):
+                addresses = [address for _, _, records, _ in answers for address in records]
+                if not addresses:
+                    raise socket.gaierror(socket.EAI_NODATA, "No address associated with hostname")
+                ttls = [ttl for _, _, _, ttl in answers if ttl is not None]
+                return addresses, min(ttls) if ttls else None
+        return await self.fallback.resolve(host, port), None
+
+    async def _query(
+        self, nameserver: tuple[str, int], name: str, record_type: int
+    ) -> tuple[int, bool, list[tuple[int, str]], int | None]:
+        query_id = random.getrandbits(16)
+        loop = asyncio.get_running_loop()
+        # A fresh socket per query gets a random source port, which makes spoofed answers harder
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _QueryProtocol(query_id), remote_addr=nameserver
+        )
+        try:
+            transport.sendto(_encode_query(query_id, name, record_type))
+            return await asyncio.wait_for(protocol.answer, self.timeout)
+        finally:
+            transport.close()
+
+
+class CachingResolver:
+    """Caches another resolver's answers in process, including failures.
+
+    Answers are kept for `ttl` seconds, or for the records' own TTL if that
+    is shorter and the resolver reports it (as DnsResolver does through
+    `resolve_with_ttl`); getaddrinfo doesn't, so its answers are kept for
+    `ttl`. Failures are kept for `negative_ttl`. Concurrent lookups of the
+    same host share a single query.
+    """
+
+    def __init__(
+        self,
+        resolver: Resolver | None = None,
+        ttl: float = 60.0,
+        negative_ttl: float = 10.0,
+        max_entries: int = 1024,
+    ):
+        self.resolver = resolver or DnsResolver()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # Failures are kept as gaierror arguments, so each hit raises a fresh exception rather than
+        # re-raising one whose traceback grows and keeps old frames alive
+        self._entries: OrderedDict[tuple[str, int], tuple[float, list[tuple[int, str]] | tuple]] = OrderedDict()
+        self._lookups: dict[tuple[str, int], asyncio.Future] = {}
+
+    async def resolve(self, host: str, port: int) -> list[tuple[int, str]]:
+        key = (host.lower(), port)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            metrics.increment("dns_cache_hits")
+            answer = entry[1]
+            if isinstance(answer, tuple):
+                raise socket.gaierror(*answer)
+            return answer
+
+        lookup = self._lookups.get(key)
+        if lookup is None:
+            metrics.increment("dns_cache_misses")
+            lookup = self._lookups[key] = asyncio.ensure_future(self._lookup(key))
+            lookup.add_done_callback(lambda _: self._lookups.pop(key, None))
+        try:
+            return await asyncio.shield(lookup)
+        except socket.gaierror as e:
+            # Callers sharing a lookup each get their own exception
+            raise socket.gaierror(*e.args) from None
+
+    async def _lookup(self, key: tuple[str, int]) -> list[tuple[int, str]]:
+        resolve_with_ttl = getattr(self.resolver, "resolve_with_ttl", None)
+        try:
+            if resolve_with_ttl is not None:
+                addresses, record_ttl = await resolve_with_ttl(*key)
+            else:
+                addresses, record_ttl = await self.resolver.resolve(*key), None
+        except socket.gaierror as e:
+            self._store(key, self.negative_ttl, e.args)
+            raise
+        self._store(key, self.ttl if record_ttl is None else min(self.ttl, record_ttl), addresses)
+        return addresses
+
+    def _store(self, key: tuple[str, int], ttl: float, answer: list[tuple[int, str]] | tuple) -> None:
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _interleave(addresses: Iterable[tuple[int, str]]) -> list[str]:
+    """Order addresses by alternating families, starting with the first one listed (RFC 8305)."""
+    by_family: OrderedDict[int, list[str]] = OrderedDict()
+    for family, address in addresses:
+        by_family.setdefault(family, []).append(address)
+    ordered = []
+    queues = list(by_family.values())
+    while any(queues):
+        for queue in queues:
+            if queue:
+                ordered.append(queue.pop(0))
+    return ordered
+
+
+class ResolvingBackend(httpcore.AsyncNetworkBackend):
+    """An httpcore network backend that resolves names with a pluggable Resolver.
+
+    When a name has several addresses, connections are raced Happy Eyeballs
+    style: the next address is tried if the previous attempt hasn't
+    connected within `happy_eyeballs_delay`, and the first to connect wins.
+    """
+
+    def __init__(
+        self,
+        resolver: Resolver,
+        happy_eyeballs_delay: float = 0.25,
+        backend: httpcore.AsyncNetworkBackend | None = None,
+    ):
+        self.resolver = resolver
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Iterable[httpcore.SOCKET_OPTION] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+
+        try:
+            addresses = _interleave(await self.resolver.resolve(host, port))
+        except socket.gaierror as e:
+            raise httpcore.ConnectError(f"Failed to resolve {host}: {e}") from e
+        if not addresses:
+            raise httpcore.ConnectError(f"Failed to resolve {host}: no addresses")
+
+        async def connect(address: str) -> httpcore.AsyncNetworkStream:
+            return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+
+        return await self._race(connect, addresses)
+
+    async def _race(self, connect, addresses: list[str]) -> httpcore.AsyncNetworkStream:
+        attempts: set[asyncio.Task] = set()
+        error: BaseException | None = None
+        winner: httpcore.AsyncNetworkStream | None = None
+        remaining = list(addresses)
+        try:
+            while winner is None and (remaining or attempts):
+                if remaining:
+                    attempts.add(asyncio.ensure_future(connect(remaining.pop(0))))
+                done, attempts = await asyncio.wait(
+                    attempts,
+                    timeout=self.happy_eyeballs_delay if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        await task.result().aclose()
+        finally:
+            for task in attempts:
+                task.cancel()
+        if winner is None:
+            assert error is not None
+            raise error
+        return winner
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: float | None = None,
+        socket_options: Iterable[httpcore.SOCKET_OPTION] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
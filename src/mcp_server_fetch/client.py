@@ -0,0 +1,223 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpcore
+import httpx
+
+from .resolver import CachingResolver, Resolver, ResolvingBackend
+
+# Statuses worth retrying a GET for: the upstream or a gateway in front of it is briefly unavailable
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# Transport errors worth retrying; others, such as an unsupported scheme or a bad URL, fail the same way every time
+RETRY_ERRORS = (httpx.ConnectError, httpx.ReadError, httpx.RemoteProtocolError, httpx.TimeoutException)
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    """Timeouts, retries and hedging for outbound requests."""
+
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 10.0
+    # Overall budget for everything a single tool call sends upstream, including robots.txt
+    deadline: float = 60.0
+    retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 5.0
+    # Send a second, identical request if the first hasn't answered in time
+    hedge: bool = False
+    # Seconds to wait before hedging; None uses the observed p95 latency
+    hedge_after: float | None = None
+    # Negotiate HTTP/2 where the upstream supports it (needs the h2 package)
+    http2: bool = False
+    # Seconds to cache DNS answers in process (0 uses httpx's own resolution), and failures
+    dns_cache_ttl: float = 60.0
+    dns_negative_ttl: float = 10.0
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number `attempt` (starting at 0)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+DEFAULT_HTTP_SETTINGS = HttpSettings()
+
+
+def new_client(
+    proxy_url: str | None = None,
+    settings: HttpSettings = DEFAULT_HTTP_SETTINGS,
+    network_backend: httpcore.AsyncNetworkBackend | None = None,
+) -> httpx.AsyncClient:
+    """Create a client for upstream requests.
+
+    httpx advertises and incrementally decodes every content encoding it has
+    a decoder for, so Brotli and zstd are used when the brotli and zstandard
+    packages are installed.
+    """
+    client = httpx.AsyncClient(proxies=proxy_url, timeout=settings.timeout(), http2=settings.http2)
+    if network_backend is not None:
+        # httpx doesn't take a network backend, so hand it to the connection pools it built
+        # (the default transport and any proxy mounts) so name resolution goes through it
+        for transport in [client._transport, *client._mounts.values()]:
+            pool = getattr(transport, "_pool", None)
+            if pool is not None:
+                pool._network_backend = network_backend
+    return client
+
+
+def new_network_backend(settings: HttpSettings, resolver: Resolver | None = None) -> ResolvingBackend | None:
+    """Create the backend that resolves names for upstream connections, or None to use httpx's own."""
+    if resolver is None:
+        if settings.dns_cache_ttl <= 0:
+            return None
+        resolver = CachingResolver(ttl=settings.dns_cache_ttl, negative_ttl=settings.dns_negative_ttl)
+    return ResolvingBackend(resolver)
+
+
+class ClientPool:
+    """Long-lived clients shared between tool calls, one per proxy.
+
+    Sharing a client keeps connections alive between calls, and with HTTP/2
+    lets concurrent requests to the same origin share a single connection.
+    """
+
+    def __init__(self, settings: HttpSettings = DEFAULT_HTTP_SETTINGS, resolver: Resolver | None = None):
+        self.settings = settings
+        self.network_backend = new_network_backend(settings, resolver)
+        self._clients: dict[str | None, httpx.AsyncClient] = {}
+
+    def client(self, proxy_url: str | None = None) -> httpx.AsyncClient:
+        client = self._clients.get(proxy_url)
+        if client is None or client.is_closed:
+            client = self._clients[proxy_url] = new_client(proxy_url, self.settings, self.network_backend)
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+@asynccontextmanager
+async def borrow_client(
+    clients: ClientPool | None, proxy_url: str | None, settings: HttpSettings
+) -> AsyncIterator[httpx.AsyncClient]:
+    """Use a client from the pool, or a throwaway one if there is no pool."""
+    if clients is not None:
+        yield clients.client(proxy_url)
+    else:
+        async with new_client(proxy_url, settings) as client:
+            yield client
+
+
+class LatencyTracker:
+    """Rolling window of request latencies, used to pick a hedging delay."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+latencies = LatencyTracker()
+
+
+async def _hedged(send: Callable[[], Awaitable[httpx.Response]], delay: float) -> httpx.Response:
+    """Run `send`, starting a second copy if the first hasn't finished after `delay` seconds.
+
+    The first attempt to succeed wins and the other is cancelled. If both
+    fail, the last error is raised.
+    """
+    pending = {asyncio.ensure_future(send())}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            pending.add(asyncio.ensure_future(send()))
+        error: BaseException | None = None
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                assert error is not None
+                raise error
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("retry-after", "")
+    return float(value) if value.isdigit() else None
+
+
+async def get(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict[str, str],
+    settings: HttpSettings = DEFAULT_HTTP_SETTINGS,
+) -> httpx.Response:
+    """GET a URL, retrying transient transport errors and statuses with jittered backoff.
+
+    Args:
+        client: Client to send the request with
+        url: URL to fetch, following redirects
+        headers: Request headers
+        settings: Retry and hedging settings
+
+    Returns:
+        The final response, which may still have an error status
+
+    Raises:
+        httpx.HTTPError: If the last attempt failed to get a response
+    """
+
+    async def send() -> httpx.Response:
+        started = time.monotonic()
+        response = await client.get(url, follow_redirects=True, headers=headers)
+        latencies.record(time.monotonic() - started)
+        return response
+
+    attempt = 0
+    while True:
+        last_attempt = attempt >= settings.retries
+        delay = settings.hedge_after if settings.hedge_after is not None else latencies.percentile(0.95)
+        try:
+            if settings.hedge and delay is not None:
+                response = await _hedged(send, delay)
+            else:
+                response = await send()
+        except RETRY_ERRORS:
+            if last_attempt:
+                raise
+            wait = settings.backoff(attempt)
+        else:
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+            retry_after = _retry_after(response)
+            wait = min(retry_after, settings.backoff_max) if retry_after is not None else settings.backoff(attempt)
+        await asyncio.sleep(wait)
+        attempt += 1
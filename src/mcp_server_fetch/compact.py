@@ -0,0 +1,167 @@
+import re
+from typing import Callable, Iterator, Literal, NamedTuple
+
+CompactMode = Literal["none", "footnotes", "text"]
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_LINK_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+\.)\s+(?:\[[^\]]*\]\((?:[^()]|\([^()]*\))*\)\s*)+$")
+_LINK_OPEN_RE = re.compile(r"(!?)\[([^\[\]]*)\]\(")
+_LINK_CLOSE_RE = re.compile(r"[ \t]*(?:\"[^\"\n]{0,256}\"|'[^'\n]{0,256}')?[ \t]*\)")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_INNER_SPACES_RE = re.compile(r"(?<=\S)[ \t]{2,}(?=\S)")
+
+# Longest link destination recognized; longer ones are left as plain text
+MAX_LINK_DESTINATION = 2048
+
+# A run of at least this many list items that are nothing but links is treated as navigation
+MIN_NAV_LIST_ITEMS = 4
+
+
+class Link(NamedTuple):
+    """An inline markdown link or image, spanning ``text[start:end]``."""
+
+    start: int
+    end: int
+    label: str
+    url: str
+    image: bool
+
+
+def _link_destination(text: str, pos: int) -> tuple[str | None, int]:
+    """Parse the destination of an inline link starting at `pos`.
+
+    Returns the destination, or None if there isn't a valid one, and the
+    position the scan stopped at. Scans stop at the end of the line and
+    after MAX_LINK_DESTINATION characters, so that no part of the text is
+    scanned twice.
+    """
+    while pos < len(text) and text[pos] in " \t":
+        pos += 1
+    limit = text.find("\n", pos, pos + MAX_LINK_DESTINATION)
+    if limit == -1:
+        limit = min(len(text), pos + MAX_LINK_DESTINATION)
+    if text.startswith("<", pos):
+        end = text.find(">", pos, limit)
+        if end == -1:
+            return None, limit
+        return text[pos + 1:end], end + 1
+    # Bare destinations may contain balanced parentheses, as in https://en.wikipedia.org/wiki/Foo_(bar)
+    start, depth = pos, 0
+    while pos < limit and not text[pos].isspace():
+        if text[pos] == "(":
+            depth += 1
+        elif text[pos] == ")":
+            if depth == 0:
+                break
+            depth -= 1
+        pos += 1
+    if depth:
+        return None, pos
+    return text[start:pos], pos
+
+
+def iter_links(text: str) -> Iterator[Link]:
+    """Yield the inline links and images in markdown text, in order, in time linear in its length."""
+    pos = 0
+    while match := _LINK_OPEN_RE.search(text, pos):
+        url, after = _link_destination(text, match.end())
+        if url is not None:
+            close = _LINK_CLOSE_RE.match(text, after)
+            if close is not None:
+                yield Link(match.start(), close.end(), match.group(2), url, bool(match.group(1)))
+                pos = close.end()
+                continue
+        # Resume after the part already scanned, so that no character is scanned twice
+        pos = max(match.start() + 1, after)
+
+
+def _replace_links(text: str, replace: Callable[[Link], str]) -> str:
+    """Replace each inline link or image in text with what `replace` returns for it."""
+    parts: list[str] = []
+    pos = 0
+    for link in iter_links(text):
+        parts.append(text[pos:link.start])
+        parts.append(replace(link))
+        pos = link.end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _prune_link_lists(lines: list[str]) -> list[str]:
+    """Drop runs of list items that consist only of links, such as navigation menus."""
+    kept: list[str] = []
+    run: list[str] = []
+    for line in lines + [""]:
+        if _LINK_ITEM_RE.match(line):
+            run.append(line)
+            continue
+        if len(run) < MIN_NAV_LIST_ITEMS:
+            kept.extend(run)
+        run = []
+        kept.append(line)
+    return kept[:-1]
+
+
+def _compact_prose(text: str, mode: CompactMode, references: dict[str, int]) -> str:
+    lines = [line.rstrip() for line in text.split("\n")]
+    text = "\n".join(_prune_link_lists(lines))
+    # Images go first, so that a linked image leaves an empty link behind to be dropped
+    text = _replace_links(text, lambda link: "" if link.image else text[link.start:link.end])
+
+    def replace_link(link: Link) -> str:
+        label, url = link.label.strip(), link.url
+        if not label:
+            return ""
+        if mode == "text" or not url or url.startswith("#"):
+            return label
+        number = references.setdefault(url, len(references) + 1)
+        return f"[{label}][{number}]"
+
+    text = _replace_links(text, replace_link)
+    text = _INNER_SPACES_RE.sub(" ", text)
+    return _BLANK_LINES_RE.sub("\n\n", text)
+
+
+def compact_markdown(content: str, mode: CompactMode = "footnotes") -> str:
+    """Shrink markdown so that each window of it carries more content.
+
+    Images and navigation-style lists of links are removed, blank lines and
+    runs of spaces are collapsed, and link URLs are either moved into
+    numbered references at the end of the document (``footnotes``) or
+    dropped in favour of the link text (``text``). Fenced code blocks are
+    left untouched.
+
+    Args:
+        content: Markdown to compact
+        mode: How to compact links; ``none`` returns the content unchanged
+
+    Returns:
+        The compacted markdown
+    """
+    if mode == "none":
+        return content
+
+    references: dict[str, int] = {}
+    blocks: list[str] = []
+    lines: list[str] = []
+    in_fence = False
+    for line in content.split("\n"):
+        if _FENCE_RE.match(line):
+            if in_fence:
+                blocks.append("\n".join(lines + [line]))
+            else:
+                blocks.append(_compact_prose("\n".join(lines), mode, references))
+            lines = [] if in_fence else [line]
+            in_fence = not in_fence
+        else:
+            lines.append(line)
+    if in_fence:
+        blocks.append("\n".join(lines))
+    else:
+        blocks.append(_compact_prose("\n".join(lines), mode, references))
+
+    compacted = "\n\n".join(block.strip("\n") for block in blocks if block.strip())
+    if references:
+        definitions = "\n".join(f"[{number}]: {url}" for url, number in references.items())
+        compacted += f"\n\n{definitions}"
+    return compacted + "\n"
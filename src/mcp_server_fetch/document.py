@@ -0,0 +1,471 @@
+import hashlib
+import re
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Iterable, Iterator
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+_HEADING_RE = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+# Longest regular expression accepted by Document.search
+MAX_REGEX_LENGTH = 256
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """A heading-delimited slice of a converted document."""
+
+    id: int
+    heading: str | None
+    level: int
+    start: int
+    end: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    """A match found in a document, with the text surrounding it."""
+
+    start: int
+    end: int
+    snippet: str
+    chunk_id: int
+
+
+def split_chunks(content: str) -> list[Chunk]:
+    """Split markdown into chunks that each start at an ATX heading.
+
+    Text before the first heading becomes chunk 0 with no heading. Headings
+    inside fenced code blocks are ignored.
+
+    Args:
+        content: Markdown content to split
+
+    Returns:
+        Chunks covering the whole of `content`, in document order
+    """
+    boundaries: list[tuple[int, str | None, int]] = [(0, None, 0)]
+    in_fence = False
+    offset = 0
+    for line in content.splitlines(keepends=True):
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = _HEADING_RE.match(line.rstrip("\r\n"))
+            if match:
+                heading = match.group(2).strip()
+                level = len(match.group(1))
+                if offset == 0:
+                    boundaries[0] = (0, heading, level)
+                else:
+                    boundaries.append((offset, heading, level))
+        offset += len(line)
+
+    chunks = []
+    for i, (start, heading, level) in enumerate(boundaries):
+        end = boundaries[i + 1][0] if i + 1 < len(boundaries) else len(content)
+        chunks.append(Chunk(id=i, heading=heading, level=level, start=start, end=end))
+    return chunks
+
+
+def _normalize_heading(heading: str) -> str:
+    return " ".join(heading.lower().split())
+
+
+class CompressedText:
+    """Text stored as independently compressed blocks of UTF-8.
+
+    Every block holds `block_size` characters (the last may hold fewer), so
+    the blocks covering a character range are found by division and only
+    those are decompressed. Block byte offsets into the single compressed
+    blob are kept in a compact array.
+    """
+
+    __slots__ = ("_data", "_offsets", "_length", "_block_size")
+
+    def __init__(self, text: str, block_size: int = 16384, level: int = 6):
+        self._length = len(text)
+        self._block_size = block_size
+        blocks = [
+            zlib.compress(text[start : start + block_size].encode("utf-8", "surrogatepass"), level)
+            for start in range(0, len(text), block_size)
+        ]
+        self._offsets = array("Q", [0])
+        for block in blocks:
+            self._offsets.append(self._offsets[-1] + len(block))
+        self._data = b"".join(blocks)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def compressed_size(self) -> int:
+        return len(self._data) + self._offsets.itemsize * len(self._offsets)
+
+    def _block(self, index: int) -> str:
+        data = self._data[self._offsets[index] : self._offsets[index + 1]]
+        return zlib.decompress(data).decode("utf-8", "surrogatepass")
+
+    def slice(self, start: int = 0, end: int | None = None) -> str:
+        """Return text[start:end], decompressing only the blocks it overlaps."""
+        start, end, _ = slice(start, end).indices(self._length)
+        if start >= end:
+            return ""
+        first = start // self._block_size
+        last = (end - 1) // self._block_size
+        text = "".join(self._block(index) for index in range(first, last + 1))
+        offset = first * self._block_size
+        return text[start - offset : end - offset]
+
+
+class Document:
+    """A fetched page, converted and indexed into heading-delimited chunks.
+
+    The content is kept compressed; windows of it are decompressed on demand.
+    """
+
+    __slots__ = ("prefix", "markdown", "source_size", "links", "chunks", "_text", "_starts", "_headings")
+
+    def __init__(
+        self,
+        content: str,
+        prefix: str = "",
+        markdown: bool = True,
+        source_size: int = 0,
+        links: list[str] | None = None,
+    ):
+        self._text = CompressedText(content)
+        self.prefix = prefix
+        self.markdown = markdown
+        # Length of the downloaded page the document was converted from
+        self.source_size = source_size
+        # Link destinations of the markdown before it was compacted, since compaction drops them from the content
+        self.links = links
+        if markdown:
+            self.chunks = split_chunks(content)
+        else:
+            self.chunks = [Chunk(id=0, heading=None, level=0, start=0, end=len(content))]
+        self._starts = [chunk.start for chunk in self.chunks]
+        self._headings: dict[str, int] = {}
+        for chunk in self.chunks:
+            if chunk.heading is not None:
+                self._headings.setdefault(_normalize_heading(chunk.heading), chunk.id)
+
+    def __len__(self) -> int:
+        return len(self._text)
+
+    @property
+    def content(self) -> str:
+        return self._text.slice()
+
+    @property
+    def compressed_size(self) -> int:
+        return self._text.compressed_size
+
+    def chunk(self, chunk_id: int) -> Chunk | None:
+        """Return the chunk with the given id, or None if out of range."""
+        if 0 <= chunk_id < len(self.chunks):
+            return self.chunks[chunk_id]
+        return None
+
+    def find_section(self, heading: str) -> Chunk | None:
+        """Return the first chunk whose heading matches, ignoring case and spacing.
+
+        An exact match is preferred; otherwise the first heading containing
+        `heading` is returned.
+        """
+        wanted = _normalize_heading(heading)
+        chunk_id = self._headings.get(wanted)
+        if chunk_id is not None:
+            return self.chunks[chunk_id]
+        for name, chunk_id in self._headings.items():
+            if wanted in name:
+                return self.chunks[chunk_id]
+        return None
+
+    def chunk_at(self, offset: int) -> Chunk:
+        """Return the chunk containing the given character offset."""
+        return self.chunks[max(bisect_right(self._starts, offset) - 1, 0)]
+
+    def text(self, start: int = 0, end: int | None = None) -> str:
+        return self._text.slice(start, end)
+
+    @staticmethod
+    def _substring_spans(content: str, query: str) -> Iterator[tuple[int, int]]:
+        lowered = content.lower()
+        if len(lowered) != len(content):
+            # Some characters change length when lowercased, so offsets wouldn't line up
+            for match in re.finditer(re.escape(query), content, re.IGNORECASE):
+                yield match.span()
+            return
+        query = query.lower()
+        offset = lowered.find(query)
+        while offset != -1:
+            yield offset, offset + len(query)
+            offset = lowered.find(query, offset + 1)
+
+    def search(
+        self, query: str, regex: bool = False, max_results: int = 20, context: int = 200
+    ) -> list[SearchHit]:
+        """Find occurrences of a query in the document.
+
+        Args:
+            query: Case-insensitive substring, or a regular expression if `regex` is set
+            regex: Treat `query` as a regular expression
+            max_results: Maximum number of hits to return
+            context: Number of characters of surrounding text to include on each side
+
+        Returns:
+            Hits in document order
+
+        Raises:
+            re.error: If `query` is not a valid regular expression, or one that could take too long to run
+        """
+        content = self.content
+        if regex:
+            check_regex(query)
+            spans = (
+                match.span()
+                for match in re.finditer(query, content, re.IGNORECASE | re.MULTILINE)
+                if match.end() > match.start()
+            )
+        else:
+            spans = self._substring_spans(content, query)
+
+        return self.hits(spans, max_results, context)
+
+    def hits(self, spans: Iterable[tuple[int, int]], max_results: int = 20, context: int = 200) -> list[SearchHit]:
+        """Turn match spans, in document order, into hits with surrounding snippets."""
+        hits = []
+        for start, end in spans:
+            if len(hits) >= max_results:
+                break
+            snippet = self.text(max(start - context, 0), end + context)
+            hits.append(SearchHit(start=start, end=end, snippet=snippet, chunk_id=self.chunk_at(start).id))
+        return hits
+
+    def table_of_contents(self) -> str:
+        """Return a compact table of contents, one line per chunk."""
+        lines = []
+        for chunk in self.chunks:
+            indent = "  " * max(chunk.level - 1, 0)
+            heading = chunk.heading if chunk.heading is not None else "(preamble)"
+            lines.append(f"{indent}[{chunk.id}] {heading} (start_index={chunk.start}, length={chunk.length})")
+        return "\n".join(lines)
+
+
+def _check_deterministic(branches) -> None:
+    """Reject alternatives that more than one of could match at the same position."""
+    firsts = [branch[0][1] if branch and branch[0][0] == sre_constants.LITERAL else None for branch in branches]
+    if None in firsts or len({chr(first).lower() for first in firsts}) < len(firsts):
+        raise re.error(
+            "alternatives inside unbounded repetition, such as (.|\\s)*, can take exponential time; "
+            "use a character class such as [\\s\\S]* instead"
+        )
+
+
+def _check_repeats(pattern, in_repeat: bool) -> None:
+    for op, av in pattern:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, item = av
+            if in_repeat and low != high:
+                raise re.error("nested repetition, such as (a+)+, can take exponential time")
+            _check_repeats(item, in_repeat or high == sre_constants.MAXREPEAT)
+        elif op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            raise re.error("backreferences are not supported")
+        elif op == sre_constants.SUBPATTERN:
+            _check_repeats(av[-1], in_repeat)
+        elif op == sre_constants.BRANCH:
+            if in_repeat:
+                _check_deterministic(av[1])
+            for branch in av[1]:
+                _check_repeats(branch, in_repeat)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check_repeats(av[1], in_repeat)
+
+
+def check_regex(pattern: str) -> None:
+    """Reject regular expressions that could backtrack for a very long time.
+
+    The re module holds the GIL while matching, so a pathological pattern
+    would stall every thread, including the event loop. Long patterns,
+    repetition nested inside unbounded repetition, alternation inside
+    unbounded repetition unless each alternative starts with a different
+    literal character, and backreferences are rejected.
+
+    Raises:
+        re.error: If the pattern is invalid or rejected
+    """
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise re.error(f"pattern is longer than {MAX_REGEX_LENGTH} characters")
+    _check_repeats(sre_parse.parse(pattern), False)
+
+
+def normalize_url(url: str, strip_query_params: Iterable[str] = ()) -> str:
+    """Normalize a URL so that equivalent spellings share a cache entry.
+
+    The scheme and host are lowercased, default ports and the fragment are
+    dropped, query parameters matching `strip_query_params` (shell-style
+    patterns such as ``utm_*``) are removed and the rest are sorted.
+
+    Args:
+        url: URL to normalize
+        strip_query_params: Patterns of query parameter names to remove
+
+    Returns:
+        The normalized URL
+    """
+    parsed = urlsplit(url)
+    scheme = parsed.scheme.lower()
+
+    userinfo, _, hostport = parsed.netloc.rpartition("@")
+    host, port = hostport.lower(), None
+    if parsed.port is not None:
+        host = hostport.rsplit(":", 1)[0].lower()
+        port = parsed.port
+    if (scheme, port) in (("http", 80), ("https", 443)):
+        port = None
+    netloc = f"{userinfo}@" if userinfo else ""
+    netloc += host if port is None else f"{host}:{port}"
+
+    patterns = [pattern.lower() for pattern in strip_query_params]
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not any(fnmatchcase(name.lower(), pattern) for pattern in patterns)
+    )
+    return urlunsplit((scheme, netloc, parsed.path or "/", urlencode(query), ""))
+
+
+def content_digest(body: str, *variant: object) -> str:
+    """Hash a response body, together with anything else that affects its conversion."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(variant).encode())
+    digest.update(body.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+DEFAULT_STRIP_QUERY_PARAMS = (
+    "utm_*",
+    "fbclid",
+    "gclid",
+    "dclid",
+    "msclkid",
+    "mc_cid",
+    "mc_eid",
+    "_ga",
+    "ref_src",
+)
+
+
+class DocumentCache:
+    """A two-level LRU cache of converted documents with a time-to-live.
+
+    URLs are normalized and mapped to the digest of the body they returned,
+    and each digest maps to a single converted Document. Byte-identical
+    bodies served under different URLs are therefore converted and stored
+    once. A document is dropped when the last URL referring to it expires
+    or is evicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        ttl: float = 300.0,
+        strip_query_params: Iterable[str] = DEFAULT_STRIP_QUERY_PARAMS,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.strip_query_params = tuple(strip_query_params)
+        # (normalized URL, raw, compact) -> (stored at, body digest, URL served from after redirects)
+        self._urls: OrderedDict[tuple[str, bool, str], tuple[float, str, str]] = OrderedDict()
+        self._documents: dict[str, Document] = {}
+        self._refcounts: Counter[str] = Counter()
+        self.stats: Counter[str] = Counter()
+
+    def key(self, url: str) -> str:
+        return normalize_url(url, self.strip_query_params)
+
+    def get(self, url: str, raw: bool, compact: str = "none") -> Document | None:
+        key = (self.key(url), raw, compact)
+        entry = self._urls.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        stored_at, digest, _ = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self._remove(key)
+            self.stats["misses"] += 1
+            return None
+        self._urls.move_to_end(key)
+        self.stats["hits"] += 1
+        return self._documents[digest]
+
+    def get_by_digest(self, digest: str) -> Document | None:
+        """Return the document already converted from a body with this digest, if any."""
+        document = self._documents.get(digest)
+        if document is not None:
+            self.stats["shared"] += 1
+        return document
+
+    def final_url(self, url: str, raw: bool = False, compact: str = "none") -> str | None:
+        """Return the URL a cached document was served from after redirects, without counting a hit or miss."""
+        entry = self._urls.get((self.key(url), raw, compact))
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[2]
+
+    def put(
+        self,
+        url: str,
+        raw: bool,
+        digest: str,
+        document: Document,
+        compact: str = "none",
+        final_url: str | None = None,
+    ) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (self.key(url), raw, compact)
+        if key in self._urls:
+            self._remove(key)
+        self._urls[key] = (time.monotonic(), digest, final_url or url)
+        self._documents.setdefault(digest, document)
+        self._refcounts[digest] += 1
+        while len(self._urls) > self.max_entries:
+            self._remove(next(iter(self._urls)))
+
+    def _remove(self, key: tuple[str, bool, str]) -> None:
+        _, digest, _ = self._urls.pop(key)
+        self._refcounts[digest] -= 1
+        if self._refcounts[digest] <= 0:
+            del self._refcounts[digest]
+            del self._documents[digest]
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def contains(self, url: str, raw: bool = False, compact: str = "none") -> bool:
+        """Whether a document for the URL is cached, without counting a hit or miss."""
+        entry = self._urls.get((self.key(url), raw, compact))
+        return entry is not None and time.monotonic() - entry[0] <= self.ttl
+
+    def __contains__(self, url: str) -> bool:
+        """Whether a converted (not raw or compacted) document for the URL is cached."""
+        return self.contains(url)
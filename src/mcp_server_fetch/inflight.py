@@ -0,0 +1,72 @@
+import asyncio
+from typing import Awaitable, Hashable, TypeVar
+
+from .metrics import metrics
+
+T = TypeVar("T")
+
+
+class RequestCancelled(Exception):
+    """Raised from a tool call that the client cancelled."""
+
+
+class InflightRegistry:
+    """Tool calls currently running, so a client can cancel them.
+
+    Calls are keyed by JSON-RPC request id. Where one registry serves several
+    clients, whose ids overlap, key by (session, request id) instead.
+    """
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._cancelled: set[asyncio.Task] = set()
+        metrics.gauge("tool_calls_in_flight", lambda: len(self._tasks))
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def run(self, request_id: Hashable, work: Awaitable[T]) -> T:
+        """Run the work for a tool call in its own task until it finishes or is cancelled.
+
+        If another call with the same key is still running, the work runs
+        without being registered, so it can't be cancelled but doesn't take
+        over the other call's entry either.
+
+        Raises:
+            RequestCancelled: If `cancel` was called for `request_id` before the work finished
+        """
+        task = asyncio.ensure_future(work)
+        if request_id is None:
+            return await task
+        registered = request_id not in self._tasks
+        if registered:
+            self._tasks[request_id] = task
+        metrics.increment("tool_calls_started")
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Counted here rather than in cancel, since the stdio server's session
+            # cancels the handler awaiting this call directly
+            if registered:
+                metrics.increment("tool_calls_cancelled")
+            if task in self._cancelled:
+                raise RequestCancelled(f"Request {request_id} was cancelled by the client")
+            raise
+        finally:
+            if registered and self._tasks.get(request_id) is task:
+                del self._tasks[request_id]
+            self._cancelled.discard(task)
+
+    def cancel(self, request_id: Hashable) -> bool:
+        """Cancel the tool call with the given request id, if it is still running.
+
+        The HTTP request is aborted by the cancellation; an extraction that
+        is still queued is dropped, and one already running is left to finish
+        in its worker thread with its result discarded.
+        """
+        task = self._tasks.get(request_id)
+        if task is None or task.done():
+            return False
+        self._cancelled.add(task)
+        task.cancel()
+        return True
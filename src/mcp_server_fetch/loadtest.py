@@ -0,0 +1,451 @@
+import asyncio
+import itertools
+import json
+import random
+import shlex
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Protocol
+from urllib.parse import quote, unquote, urlsplit, urlunsplit
+
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+
+
+@dataclass(frozen=True)
+class ToolCall:
+    name: str
+    arguments: dict[str, Any]
+
+
+def read_calls(path: str) -> list[ToolCall]:
+    """Read tool calls from a JSONL file.
+
+    Each line is either ``{"name": ..., "arguments": {...}}`` or a logged
+    JSON-RPC message; messages other than ``tools/call`` are skipped, so a
+    raw log of MCP traffic can be replayed as is.
+
+    Raises:
+        ValueError: If a line is not valid JSON, or the file has no tool calls
+    """
+    calls = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: {e}") from e
+            if "method" in message:
+                if message["method"] != "tools/call":
+                    continue
+                message = message.get("params", {})
+            if "name" not in message:
+                continue
+            calls.append(ToolCall(message["name"], dict(message.get("arguments") or {})))
+    if not calls:
+        raise ValueError(f"{path} has no tool calls")
+    return calls
+
+
+@dataclass(frozen=True)
+class RecordedResponse:
+    status: int
+    content_type: str
+    body: bytes
+    location: str | None = None
+
+
+def load_recordings(path: str) -> dict[str, RecordedResponse]:
+    """Load recorded responses, one ``{"url", "status", "content_type", "body"}`` object per line."""
+    recordings = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings[entry["url"]] = RecordedResponse(
+                    status=entry.get("status", 200),
+                    content_type=entry.get("content_type", "text/html; charset=utf-8"),
+                    body=entry["body"].encode("utf-8"),
+                )
+    return recordings
+
+
+async def record_responses(calls: Iterable[ToolCall], path: str, concurrency: int = 8) -> int:
+    """Fetch every URL the calls refer to once and save the responses for later replays.
+
+    Returns:
+        The number of responses recorded
+    """
+    # Fragments never reach the server, so they aren't part of a recording's URL
+    urls = sorted({str(call.arguments["url"]).split("#")[0] for call in calls if "url" in call.arguments})
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(client: httpx.AsyncClient, url: str) -> dict[str, Any] | None:
+        async with semaphore:
+            try:
+                response = await client.get(url, follow_redirects=True)
+            except httpx.HTTPError as e:
+                print(f"Skipping {url}: {e!r}", file=sys.stderr)
+                return None
+        return {
+            "url": url,
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", ""),
+            "body": response.text,
+        }
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        entries = await asyncio.gather(*(fetch(client, url) for url in urls))
+    recorded = [entry for entry in entries if entry is not None]
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in recorded:
+            f.write(json.dumps(entry) + "\n")
+    return len(recorded)
+
+
+class LocalHttpServer:
+    """A minimal HTTP/1.1 server on 127.0.0.1, standing in for upstream sites.
+
+    Subclasses decide how to answer each request by overriding `respond`.
+    """
+
+    def __init__(self):
+        self.port = 0
+        self._server: asyncio.Server | None = None
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def url(self, path: str = "/") -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # The fetch server may still hold idle keep-alive connections
+            for writer in self._connections:
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def respond(self, target: str) -> RecordedResponse:
+        """Answer a request for `target`, the path and query of the request line."""
+        raise NotImplementedError
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                target = request_line.split(" ")[1]
+                headers = dict(
+                    (name.strip().lower(), value.strip())
+                    for name, _, value in (line.partition(":") for line in header_lines if line)
+                )
+                response = await self.respond(target)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                head_lines = [
+                    f"HTTP/1.1 {response.status} Replayed",
+                    f"Content-Type: {response.content_type}",
+                    f"Content-Length: {len(response.body)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if response.location:
+                    head_lines.append(f"Location: {response.location}")
+                writer.write(("\r\n".join(head_lines) + "\r\n\r\n").encode("latin-1") + response.body)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+
+class ReplayServer(LocalHttpServer):
+    """A local HTTP server standing in for every upstream site, answering from recordings.
+
+    The original URL is carried in the path (its query string is kept as the
+    real query, so the fetch server's cache-key normalization still applies).
+    URLs without a recording, and robots.txt, get a 404. Every request other
+    than robots.txt is counted as an upstream fetch, including prefetches and
+    retries, which the server can't tell apart from a tool call's first fetch.
+    """
+
+    def __init__(self, recordings: dict[str, RecordedResponse], latency: float = 0.0):
+        super().__init__()
+        self.recordings = recordings
+        self.latency = latency
+        self.upstream_requests = 0
+
+    def url_for(self, url: str) -> str:
+        """The URL the fetch server should be sent to for `url`."""
+        parsed = urlsplit(url)
+        original = urlunsplit((parsed.scheme, parsed.netloc, parsed.path, "", ""))
+        return self.url(f"/{quote(original, safe='')}") + (f"?{parsed.query}" if parsed.query else "")
+
+    def _lookup(self, target: str) -> RecordedResponse | None:
+        path, _, query = target.partition("?")
+        if path == "/robots.txt":
+            return None
+        self.upstream_requests += 1
+        url = unquote(path[1:]) + (f"?{query}" if query else "")
+        return self.recordings.get(url)
+
+    async def respond(self, target: str) -> RecordedResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._lookup(target) or RecordedResponse(404, "text/plain", b"Not recorded")
+
+
+class Target(Protocol):
+    """A fetch server to send tool calls to."""
+
+    async def call(self, call: ToolCall) -> str | None:
+        """Make a tool call, returning a short description of the error if it failed."""
+        ...
+
+
+class StdioTarget:
+    """A fetch server started as a subprocess and spoken to over stdio."""
+
+    def __init__(self, command: list[str], env: dict[str, str] | None = None):
+        self.parameters = StdioServerParameters(command=command[0], args=command[1:], env=env)
+
+    async def __aenter__(self) -> "StdioTarget":
+        self._transport = stdio_client(self.parameters)
+        read, write = await self._transport.__aenter__()
+        self._session = ClientSession(read, write)
+        await self._session.__aenter__()
+        await self._session.initialize()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.__aexit__(*exc_info)
+        await self._transport.__aexit__(*exc_info)
+
+    async def call(self, call: ToolCall) -> str | None:
+        try:
+            result = await self._session.call_tool(call.name, call.arguments)
+        except McpError as e:
+            return f"error {e.error.code}"
+        return "tool error" if result.isError else None
+
+
+class HttpTarget:
+    """The app.py HTTP wrapper, spoken to with JSON-RPC POSTs to /mcp."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.endpoint = base_url.rstrip("/") + "/mcp"
+        self._client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=None))
+        self._ids = itertools.count(1)
+
+    async def __aenter__(self) -> "HttpTarget":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._client.aclose()
+
+    async def call(self, call: ToolCall) -> str | None:
+        message = {
+            "jsonrpc": "2.0",
+            "id": next(self._ids),
+            "method": "tools/call",
+            "params": {"name": call.name, "arguments": call.arguments},
+        }
+        try:
+            response = await self._client.post(self.endpoint, json=message)
+        except httpx.HTTPError as e:
+            return type(e).__name__
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}"
+        body = response.json()
+        if "error" in body:
+            return f"error {body['error'].get('code')}"
+        return "tool error" if body.get("result", {}).get("isError") else None
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+@dataclass
+class Report:
+    """The outcome of a replay."""
+
+    duration: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    upstream_requests: int = 0
+
+    def summary(self) -> dict[str, Any]:
+        calls = len(self.latencies)
+        successes = calls - sum(self.errors.values())
+        ordered = sorted(self.latencies)
+        summary: dict[str, Any] = {
+            "calls": calls,
+            "duration_s": round(self.duration, 3),
+            "throughput_per_s": round(calls / self.duration, 2) if self.duration else 0.0,
+            "error_rate": round(sum(self.errors.values()) / calls, 4) if calls else 0.0,
+            "errors": dict(self.errors),
+            "upstream_requests": self.upstream_requests,
+            # Every successful call that didn't reach upstream was answered from the document cache;
+            # failed and shed calls never got a document, so they count as neither hits nor misses.
+            # Prefetches and retries are upstream fetches too, so with either the ratio is understated
+            "cache_hit_ratio": round(max(0.0, 1 - self.upstream_requests / successes), 4) if successes else 0.0,
+        }
+        if ordered:
+            for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                summary[f"latency_{name}_ms"] = round(_percentile(ordered, fraction) * 1000, 1)
+            summary["latency_max_ms"] = round(ordered[-1] * 1000, 1)
+        return summary
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"Calls:           {summary['calls']} in {summary['duration_s']}s",
+            f"Throughput:      {summary['throughput_per_s']} calls/s",
+            f"Error rate:      {summary['error_rate']:.2%}",
+            f"Cache hit ratio: {summary['cache_hit_ratio']:.2%} ({summary['upstream_requests']} upstream fetches)",
+        ]
+        if "latency_max_ms" in summary:
+            lines.append(
+                "Latency (ms):    "
+                f"p50 {summary['latency_p50_ms']}  p90 {summary['latency_p90_ms']}  "
+                f"p99 {summary['latency_p99_ms']}  max {summary['latency_max_ms']}"
+            )
+        lines.extend(f"  {count} x {error}" for error, count in self.errors.most_common())
+        return "\n".join(lines)
+
+
+async def replay(
+    calls: list[ToolCall],
+    target: Target,
+    server: ReplayServer,
+    concurrency: int = 8,
+    rate: float | None = None,
+    timeout: float = 120.0,
+) -> Report:
+    """Send `calls` to `target`, with their URLs rewritten to point at `server`.
+
+    Without a `rate`, calls are sent back to back by `concurrency` workers
+    (a closed loop) and latency is the time each call took. With a `rate`,
+    calls arrive as a Poisson process at that many per second (an open loop)
+    and latency also counts time spent waiting for one of the `concurrency`
+    slots, so a server that falls behind shows it.
+
+    Args:
+        calls: Tool calls to make, in order
+        target: Server to make them against
+        server: Recorded-response server standing in for upstream sites
+        concurrency: Maximum number of calls in flight at once
+        rate: Mean calls per second, or None to send them as fast as possible
+        timeout: Seconds after which a call is counted as failed
+
+    Returns:
+        Latencies, errors and upstream fetch counts for the run
+    """
+    report = Report()
+    slots = asyncio.Semaphore(concurrency)
+    upstream_before = server.upstream_requests
+
+    async def send(call: ToolCall) -> None:
+        if "url" in call.arguments:
+            call = ToolCall(call.name, {**call.arguments, "url": server.url_for(str(call.arguments["url"]))})
+        arrived = time.monotonic()
+        async with slots:
+            started = arrived if rate else time.monotonic()
+            try:
+                error = await asyncio.wait_for(target.call(call), timeout)
+            except asyncio.TimeoutError:
+                error = "timeout"
+            report.latencies.append(time.monotonic() - started)
+            if error is not None:
+                report.errors[error] += 1
+
+    started = time.monotonic()
+    tasks = []
+    for call in calls:
+        tasks.append(asyncio.ensure_future(send(call)))
+        if rate:
+            await asyncio.sleep(random.expovariate(rate))
+        else:
+            # Let the task queue up on the semaphore before creating the next one
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    report.duration = time.monotonic() - started
+    report.upstream_requests = server.upstream_requests - upstream_before
+    return report
+
+
+async def run(args) -> Report:
+    calls = read_calls(args.calls) * args.repeat
+    server = ReplayServer(load_recordings(args.responses) if args.responses else {}, args.upstream_latency / 1000)
+    await server.start()
+    try:
+        if args.http:
+            target = HttpTarget(args.http, args.timeout)
+        else:
+            target = StdioTarget(shlex.split(args.server_command))
+        async with target:
+            return await replay(calls, target, server, args.concurrency, args.rate, args.timeout)
+    finally:
+        await server.aclose()
+
+
+def main():
+    """Replay a JSONL log of tool calls against a fetch server and report the results"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="replay a log of fetch tool calls against a server, with upstream sites served from recordings"
+    )
+    parser.add_argument("calls", help="JSONL file of tool calls, or of logged JSON-RPC messages")
+    parser.add_argument(
+        "--responses", help="JSONL file of recorded upstream responses (URLs without one get a 404)"
+    )
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Fetch every URL in the calls from the real sites, write them to --responses and exit",
+    )
+    parser.add_argument(
+        "--http", metavar="URL", help="Base URL of the app.py HTTP wrapper to test, instead of the stdio server"
+    )
+    parser.add_argument(
+        "--server-command",
+        default=f"{shlex.quote(sys.executable)} -m mcp_server_fetch",
+        help="Command that starts the stdio server (default: %(default)s)",
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of calls in flight at once")
+    parser.add_argument(
+        "--rate", type=float, help="Mean calls per second, arriving at random (default: as fast as possible)"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Times to replay the whole log")
+    parser.add_argument(
+        "--upstream-latency", type=float, default=0.0, help="Milliseconds the recorded-response server waits per request"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds after which a call counts as failed")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON, for comparing runs")
+
+    args = parser.parse_args()
+    if args.record:
+        if not args.responses:
+            parser.error("--record needs --responses to write to")
+        count = asyncio.run(record_responses(read_calls(args.calls), args.responses))
+        print(f"Recorded {count} responses to {args.responses}")
+        return
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report.summary(), indent=2) if args.json else report.format())
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Iterator
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from .compact import iter_links
+from .diagnostics import detach_call, to_thread
+from .document import Document, DocumentCache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class PrefetchSettings:
+    """Budget for speculatively fetching pages linked from a fetched page."""
+
+    # Number of same-origin links to prefetch from each page (0 disables prefetching)
+    links: int = 0
+    max_concurrent: int = 2
+    # Upstream bytes the prefetcher may download per minute, across all hosts
+    max_bytes_per_minute: int = 5_000_000
+    # Minimum seconds between two prefetches from the same host
+    host_interval: float = 2.0
+
+
+def same_origin_links(base_url: str, document: Document) -> Iterator[str]:
+    """Yield the distinct links in a markdown document that share the origin of `base_url`, in document order.
+
+    Links of a compacted document are taken from before compaction.
+    """
+    base = urlsplit(base_url)
+    seen = {urldefrag(base_url).url}
+    if document.links is not None:
+        hrefs: Iterable[str] = document.links
+    else:
+        hrefs = (link.url for link in iter_links(document.content) if not link.image and link.url)
+    for href in hrefs:
+        url = urldefrag(urljoin(base_url, href)).url
+        parsed = urlsplit(url)
+        if (parsed.scheme, parsed.netloc) != (base.scheme, base.netloc) or url in seen:
+            continue
+        seen.add(url)
+        yield url
+
+
+class Prefetcher:
+    """Warms the document cache with pages an agent is likely to ask for next.
+
+    The next pagination window of a page needs no prefetch, since the whole
+    converted document is already cached by the call that returned the
+    first window. Links found on the page are fetched in the background,
+    compacted like the page so that following one is a cache hit. This is
+    kept within a strict budget: at most `max_concurrent` pages have their links
+    prefetched at a time, at most `max_bytes_per_minute` is downloaded, and
+    requests to one host are spaced `host_interval` seconds apart. Work over
+    budget is skipped, not queued.
+    """
+
+    def __init__(
+        self,
+        settings: PrefetchSettings,
+        cache: DocumentCache,
+        fetch: Callable[[str, str], Awaitable[Document]],
+    ):
+        self.settings = settings
+        self.cache = cache
+        self.fetch = fetch
+        self._tasks: set[asyncio.Task] = set()
+        self._host_next_fetch: dict[str, float] = {}
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+
+    def _bytes_left(self) -> int:
+        now = time.monotonic()
+        if now - self._window_start >= 60:
+            self._window_start, self._window_bytes = now, 0
+        return self.settings.max_bytes_per_minute - self._window_bytes
+
+    def after_fetch(self, url: str, document: Document, compact: str = "none") -> None:
+        """Schedule prefetches for the links of a document that was just returned to a client.
+
+        Relative links are resolved against the URL the document was served
+        from, which differs from `url` when the fetch was redirected.
+        """
+        if self.settings.links <= 0 or not document.markdown:
+            return
+        if len(self._tasks) >= self.settings.max_concurrent:
+            metrics.increment("prefetch_skipped_busy")
+            return
+        base_url = self.cache.final_url(url, False, compact) or url
+        task = asyncio.ensure_future(self._prefetch(base_url, urldefrag(url).url, document, compact))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _wait_for_host(self, url: str) -> None:
+        """Reserve the next slot for the URL's host and sleep until it comes round."""
+        host = urlsplit(url).netloc
+        now = time.monotonic()
+        if len(self._host_next_fetch) > 1024:
+            self._host_next_fetch = {h: t for h, t in self._host_next_fetch.items() if t > now}
+        slot = max(now, self._host_next_fetch.get(host, now))
+        self._host_next_fetch[host] = slot + self.settings.host_interval
+        await asyncio.sleep(slot - now)
+
+    async def _prefetch(self, base_url: str, requested: str, document: Document, compact: str) -> None:
+        # The task inherited the context of the call that scheduled it, which may have finished
+        detach_call()
+        # Scanning a long page for links is CPU-bound, so keep it off the event loop
+        candidates = await to_thread(lambda: list(same_origin_links(base_url, document)))
+        links = []
+        for link in candidates:
+            if len(links) >= self.settings.links:
+                break
+            if link != requested and not self.cache.contains(link, compact=compact):
+                links.append(link)
+        for url in links:
+            await self._wait_for_host(url)
+            if self.cache.contains(url, compact=compact):
+                continue
+            if self._bytes_left() <= 0:
+                metrics.increment("prefetch_skipped_bytes")
+                return
+            metrics.increment("prefetch_started")
+            try:
+                document = await self.fetch(url, compact)
+            except Exception as e:
+                metrics.increment("prefetch_failed")
+                logger.debug(f"Prefetch of {url} failed: {e}")
+                continue
+            self._window_bytes += document.source_size
+            metrics.increment("prefetch_bytes", document.source_size)
+
+    async def aclose(self) -> None:
+        """Cancel any prefetches still running."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
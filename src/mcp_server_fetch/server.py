@@ -1,4 +1,9 @@
-from typing import Annotated, Tuple
+import asyncio
+import logging
+import re
+import signal
+import tempfile
+from typing import Annotated, Awaitable, Sequence, Tuple, TypeVar
 from urllib.parse import urlparse, urlunparse
 
 import markdownify
@@ -7,11 +12,14 @@ from mcp.shared.exceptions import McpError
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import (
+    CallToolRequest,
+    CallToolResult,
     ErrorData,
     GetPromptResult,
     Prompt,
     PromptArgument,
     PromptMessage,
+    ServerResult,
     TextContent,
     Tool,
     INVALID_PARAMS,
@@ -20,9 +28,26 @@ from mcp.types import (
 from protego import Protego
 from pydantic import BaseModel, Field, AnyUrl
 
+from .admission import SERVER_BUSY, AdmissionController, ServerBusy
+from .client import DEFAULT_HTTP_SETTINGS, ClientPool, HttpSettings, borrow_client, get as client_get
+from .compact import CompactMode, compact_markdown, iter_links
+from .diagnostics import Diagnostics, DiagnosticsSettings, current_call, stage, to_thread
+from .document import DEFAULT_STRIP_QUERY_PARAMS, Document, DocumentCache, SearchHit, check_regex, content_digest
+from .inflight import InflightRegistry
+from .metrics import metrics
+from .prefetch import Prefetcher, PrefetchSettings
+from .regex_worker import RegexTimeout, regex_spans
+
 DEFAULT_USER_AGENT_AUTONOMOUS = "ModelContextProtocol/1.0 (Autonomous; +https://github.com/modelcontextprotocol/servers)"
 DEFAULT_USER_AGENT_MANUAL = "ModelContextProtocol/1.0 (User-Specified; +https://github.com/modelcontextprotocol/servers)"
 
+T = TypeVar("T")
+
+# Seconds of activity captured by a profile requested with SIGUSR1
+PROFILE_SECONDS = 10
+
+logger = logging.getLogger(__name__)
+
 
 def extract_content_from_html(html: str) -> str:
     """Extract and convert HTML content to Markdown format.
@@ -33,15 +58,17 @@ def extract_content_from_html(html: str) -> str:
     Returns:
         Simplified markdown version of the content
     """
-    ret = readabilipy.simple_json.simple_json_from_html_string(
-        html, use_readability=True
-    )
+    with stage("readability"):
+        ret = readabilipy.simple_json.simple_json_from_html_string(
+            html, use_readability=True
+        )
     if not ret["content"]:
         return "<error>Page failed to be simplified from HTML</error>"
-    content = markdownify.markdownify(
-        ret["content"],
-        heading_style=markdownify.ATX,
-    )
+    with stage("markdownify"):
+        content = markdownify.markdownify(
+            ret["content"],
+            heading_style=markdownify.ATX,
+        )
     return content
 
 
@@ -63,22 +90,27 @@ def get_robots_txt_url(url: str) -> str:
     return robots_url
 
 
-async def check_may_autonomously_fetch_url(url: str, user_agent: str, proxy_url: str | None = None) -> None:
+async def check_may_autonomously_fetch_url(
+    url: str,
+    user_agent: str,
+    proxy_url: str | None = None,
+    settings: HttpSettings = DEFAULT_HTTP_SETTINGS,
+    clients: ClientPool | None = None,
+) -> None:
     """
     Check if the URL can be fetched by the user agent according to the robots.txt file.
     Raises a McpError if not.
     """
-    from httpx import AsyncClient, HTTPError
+    from httpx import HTTPError
 
     robot_txt_url = get_robots_txt_url(url)
 
-    async with AsyncClient(proxies=proxy_url) as client:
+    async with borrow_client(clients, proxy_url, settings) as client:
         try:
-            response = await client.get(
-                robot_txt_url,
-                follow_redirects=True,
-                headers={"User-Agent": user_agent},
-            )
+            with stage("robots"):
+                response = await client_get(
+                    client, robot_txt_url, {"User-Agent": user_agent}, settings
+                )
         except HTTPError:
             raise McpError(ErrorData(
                 code=INTERNAL_ERROR,
@@ -108,22 +140,23 @@ async def check_may_autonomously_fetch_url(url: str, user_agent: str, proxy_url:
         ))
 
 
-async def fetch_url(
-    url: str, user_agent: str, force_raw: bool = False, proxy_url: str | None = None
-) -> Tuple[str, str]:
+async def download_url(
+    url: str,
+    user_agent: str,
+    proxy_url: str | None = None,
+    settings: HttpSettings = DEFAULT_HTTP_SETTINGS,
+    clients: ClientPool | None = None,
+) -> Tuple[str, str, str]:
     """
-    Fetch the URL and return the content in a form ready for the LLM, as well as a prefix string with status information.
+    Download the URL and return the response body along with its content type and the URL it was served from
+    after any redirects.
     """
-    from httpx import AsyncClient, HTTPError
+    from httpx import HTTPError
 
-    async with AsyncClient(proxies=proxy_url) as client:
+    async with borrow_client(clients, proxy_url, settings) as client:
         try:
-            response = await client.get(
-                url,
-                follow_redirects=True,
-                headers={"User-Agent": user_agent},
-                timeout=30,
-            )
+            with stage("fetch"):
+                response = await client_get(client, url, {"User-Agent": user_agent}, settings)
         except HTTPError as e:
             raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
         if response.status_code >= 400:
@@ -134,12 +167,18 @@ async def fetch_url(
 
         page_raw = response.text
 
-    content_type = response.headers.get("content-type", "")
-    is_page_html = (
-        "<html" in page_raw[:100] or "text/html" in content_type or not content_type
-    )
+    return page_raw, response.headers.get("content-type", ""), str(response.url)
 
-    if is_page_html and not force_raw:
+
+def is_html(page_raw: str, content_type: str) -> bool:
+    return "<html" in page_raw[:100] or "text/html" in content_type or not content_type
+
+
+def convert_page(page_raw: str, content_type: str, force_raw: bool = False) -> Tuple[str, str]:
+    """
+    Convert a downloaded page into a form ready for the LLM, as well as a prefix string with status information.
+    """
+    if is_html(page_raw, content_type) and not force_raw:
         return extract_content_from_html(page_raw), ""
 
     return (
@@ -148,6 +187,93 @@ async def fetch_url(
     )
 
 
+def build_document(
+    page_raw: str, content_type: str, force_raw: bool = False, compact: CompactMode = "none"
+) -> Document:
+    """Convert a downloaded page, optionally compact the markdown, and index it into a Document."""
+    content, prefix = convert_page(page_raw, content_type, force_raw)
+    links = None
+    if not prefix and compact != "none":
+        with stage("compact"):
+            # Keep the link destinations for the prefetcher, since compaction drops them
+            links = [link.url for link in iter_links(content) if not link.image and link.url]
+            content = compact_markdown(content, compact)
+    with stage("index"):
+        return Document(content, prefix, markdown=not prefix, source_size=len(page_raw), links=links)
+
+
+async def fetch_url(
+    url: str,
+    user_agent: str,
+    force_raw: bool = False,
+    proxy_url: str | None = None,
+    settings: HttpSettings = DEFAULT_HTTP_SETTINGS,
+    clients: ClientPool | None = None,
+) -> Tuple[str, str]:
+    """
+    Fetch the URL and return the content in a form ready for the LLM, as well as a prefix string with status information.
+    """
+    page_raw, content_type, _ = await within_deadline(
+        download_url(url, user_agent, proxy_url, settings, clients), url, settings
+    )
+    # Extraction is CPU-bound, so keep it off the event loop; if the call is cancelled while
+    # it is still queued it never runs
+    return await to_thread(convert_page, page_raw, content_type, force_raw)
+
+
+async def within_deadline(awaitable: Awaitable[T], url: str, settings: HttpSettings) -> T:
+    """Await the upstream work for a tool call, giving up once the overall deadline has passed."""
+    try:
+        return await asyncio.wait_for(awaitable, timeout=settings.deadline)
+    except asyncio.TimeoutError:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"Failed to fetch {url} - gave up after {settings.deadline:g} seconds",
+        ))
+
+
+async def fetch_document(
+    url: str,
+    user_agent: str,
+    force_raw: bool = False,
+    proxy_url: str | None = None,
+    cache: DocumentCache | None = None,
+    check_robots: bool = False,
+    settings: HttpSettings = DEFAULT_HTTP_SETTINGS,
+    clients: ClientPool | None = None,
+    compact: CompactMode = "none",
+) -> Document:
+    """
+    Fetch the URL and return it as an indexed Document, reusing a cached copy when available.
+    Bodies identical to one already in the cache reuse its converted Document instead of being converted again.
+    The robots.txt check, if requested, is only made when the URL is not already cached.
+    """
+    profile = current_call()
+    if cache is not None:
+        document = cache.get(url, force_raw, compact)
+        if document is not None:
+            if profile is not None:
+                profile.input_size = document.source_size
+            return document
+
+    async def download() -> Tuple[str, str, str]:
+        if check_robots:
+            await check_may_autonomously_fetch_url(url, user_agent, proxy_url, settings, clients)
+        return await download_url(url, user_agent, proxy_url, settings, clients)
+
+    page_raw, content_type, final_url = await within_deadline(download(), url, settings)
+    # The digest covers everything convert_page depends on, so a shared Document is always correct
+    digest = content_digest(page_raw, force_raw, is_html(page_raw, content_type), content_type, compact)
+    document = cache.get_by_digest(digest) if cache is not None else None
+    if document is None:
+        document = await to_thread(build_document, page_raw, content_type, force_raw, compact)
+    if cache is not None:
+        cache.put(url, force_raw, digest, document, compact, final_url)
+    if profile is not None:
+        profile.input_size = len(page_raw)
+    return document
+
+
 class Fetch(BaseModel):
     """Parameters for fetching a URL."""
 
@@ -176,12 +302,212 @@ class Fetch(BaseModel):
             description="Get the actual HTML content of the requested page, without simplification.",
         ),
     ]
+    section: Annotated[
+        str | None,
+        Field(
+            default=None,
+            description="Return only the section under the heading matching this text, as listed in the table of contents. start_index is then relative to the start of the section.",
+        ),
+    ]
+    chunk_id: Annotated[
+        int | None,
+        Field(
+            default=None,
+            description="Return only the chunk with this id, as listed in the table of contents. start_index is then relative to the start of the chunk.",
+            ge=0,
+        ),
+    ]
+    compact: Annotated[
+        CompactMode,
+        Field(
+            default="none",
+            description="Shrink the markdown so each window holds more content: 'footnotes' moves link URLs into numbered references at the end of the page, 'text' drops link URLs and keeps only the link text. Both also remove images, collapse blank lines and drop navigation-style lists of links.",
+        ),
+    ]
+
+
+MAX_TOC_ENTRIES = 100
+
+
+def format_window(document: Document, args: Fetch) -> str:
+    """Select the part of a document requested by the Fetch arguments.
+
+    Without a section or chunk selector, the first call (start_index 0) is
+    preceded by a table of contents when the document has several chunks.
+
+    Args:
+        document: Document to take the window from
+        args: Validated fetch arguments
+
+    Returns:
+        The window of content, with a hint on how to continue if truncated
+    """
+    chunk = None
+    if args.chunk_id is not None:
+        chunk = document.chunk(args.chunk_id)
+        if chunk is None:
+            raise McpError(ErrorData(
+                code=INVALID_PARAMS,
+                message=f"No chunk with chunk_id {args.chunk_id}, the document has {len(document.chunks)} chunks",
+            ))
+    elif args.section is not None:
+        chunk = document.find_section(args.section)
+        if chunk is None:
+            raise McpError(ErrorData(
+                code=INVALID_PARAMS,
+                message=f"No section matching {args.section!r}. Available sections:\n{document.table_of_contents()}",
+            ))
+
+    base, limit = (chunk.start, chunk.end) if chunk is not None else (0, len(document))
+    start = base + args.start_index
+    if start >= limit:
+        return "<error>No more content available.</error>"
+    end = min(start + args.max_length, limit)
+    content = document.text(start, end)
+    if not content:
+        return "<error>No more content available.</error>"
+
+    # Only add the prompt to continue fetching if there is still remaining content
+    if end - start == args.max_length and end < limit:
+        next_start = end - base
+        if chunk is not None:
+            content += f"\n\n<error>Content truncated. Call the fetch tool with a chunk_id of {chunk.id} and a start_index of {next_start} to get more of this section.</error>"
+        else:
+            content += f"\n\n<error>Content truncated. Call the fetch tool with a start_index of {next_start} to get more content.</error>"
+
+    if chunk is None and args.start_index == 0 and len(document.chunks) > 1:
+        toc = document.table_of_contents().splitlines()
+        if len(toc) > MAX_TOC_ENTRIES:
+            toc = toc[:MAX_TOC_ENTRIES] + [f"... {len(toc) - MAX_TOC_ENTRIES} more sections"]
+        toc_text = "\n".join(toc)
+        content = (
+            f"<toc>\nThis page has {len(document.chunks)} sections. Call the fetch tool with a section or chunk_id to jump straight to one.\n"
+            f"{toc_text}\n</toc>\n\n{content}"
+        )
+    return content
+
+
+class FetchSearch(BaseModel):
+    """Parameters for searching within a fetched URL."""
+
+    url: Annotated[AnyUrl, Field(description="URL to search")]
+    query: Annotated[
+        str,
+        Field(
+            description="Text to look for. Matched as a case-insensitive substring unless regex is set.",
+            min_length=1,
+        ),
+    ]
+    regex: Annotated[
+        bool,
+        Field(
+            default=False,
+            description="Treat the query as a case-insensitive regular expression. Backreferences, nested repetition such as (a+)+ and alternation inside repetition such as (.|\\s)* are not supported; use a character class such as [\\s\\S]* instead.",
+        ),
+    ]
+    max_results: Annotated[
+        int,
+        Field(
+            default=10,
+            description="Maximum number of matches to return.",
+            gt=0,
+            le=100,
+        ),
+    ]
+    context: Annotated[
+        int,
+        Field(
+            default=200,
+            description="Number of characters of surrounding text to return on each side of a match.",
+            ge=0,
+            le=2000,
+        ),
+    ]
+    raw: Annotated[
+        bool,
+        Field(
+            default=False,
+            description="Search the actual HTML content of the requested page, without simplification.",
+        ),
+    ]
+    compact: Annotated[
+        CompactMode,
+        Field(
+            default="none",
+            description="Search the page as compacted by fetch with this compact setting, so the returned start_index offsets apply to fetch calls that use the same setting.",
+        ),
+    ]
+
+
+def format_search_results(document: Document, args: FetchSearch, hits: list[SearchHit]) -> str:
+    """Format search hits with their start_index offsets.
+
+    Args:
+        document: Document that was searched
+        args: Validated search arguments
+        hits: Hits found in the document, in document order
+
+    Returns:
+        The matching snippets, or an error tag if nothing matched
+    """
+    if not hits:
+        return f"<error>No matches for {args.query!r}.</error>"
+
+    results = []
+    for hit in hits:
+        snippet_start = max(hit.start - args.context, 0)
+        results.append(
+            f"<match start_index=\"{hit.start}\" chunk_id=\"{hit.chunk_id}\">\n"
+            f"{'...' if snippet_start > 0 else ''}{hit.snippet}{'...' if hit.end + args.context < len(document) else ''}\n"
+            f"</match>"
+        )
+    content = "\n".join(results)
+    if len(hits) == args.max_results:
+        content += f"\n\n<error>Showing the first {len(hits)} matches. Narrow the query or raise max_results to see more.</error>"
+    return content
+
+
+async def search_document(document: Document, args: FetchSearch) -> str:
+    """Search a document without stalling the event loop.
+
+    Substring searches run in a worker thread. Regular expressions known to
+    backtrack badly are rejected up front, and the rest run in a worker
+    process that is killed after REGEX_TIMEOUT seconds, since the re module
+    holds the GIL while it matches.
+    """
+    with stage("search"):
+        if not args.regex:
+            hits = await to_thread(document.search, args.query, False, args.max_results, args.context)
+            return format_search_results(document, args, hits)
+
+        try:
+            check_regex(args.query)
+        except re.error as e:
+            raise McpError(ErrorData(code=INVALID_PARAMS, message=f"Invalid regular expression: {e}"))
+        content = await to_thread(lambda: document.content)
+        try:
+            spans = await regex_spans(content, args.query, args.max_results)
+        except RegexTimeout as e:
+            metrics.increment("search_regex_timeouts")
+            raise McpError(ErrorData(
+                code=INVALID_PARAMS,
+                message=f"Regular expression search stopped: {e}. Simplify the pattern or search for a substring.",
+            ))
+        return format_search_results(document, args, document.hits(spans, args.max_results, args.context))
 
 
 async def serve(
     custom_user_agent: str | None = None,
     ignore_robots_txt: bool = False,
     proxy_url: str | None = None,
+    cache_size: int = 128,
+    strip_query_params: Sequence[str] = DEFAULT_STRIP_QUERY_PARAMS,
+    http_settings: HttpSettings = DEFAULT_HTTP_SETTINGS,
+    max_concurrent: int = 16,
+    max_queue: int = 64,
+    queue_timeout: float = 10.0,
+    prefetch_settings: PrefetchSettings = PrefetchSettings(),
+    diagnostics_settings: DiagnosticsSettings = DiagnosticsSettings(),
 ) -> None:
     """Run the fetch MCP server.
 
@@ -189,8 +515,36 @@ async def serve(
         custom_user_agent: Optional custom User-Agent string to use for requests
         ignore_robots_txt: Whether to ignore robots.txt restrictions
         proxy_url: Optional proxy URL to use for requests
+        cache_size: Maximum number of URLs to keep converted documents for in memory
+        strip_query_params: Query parameter patterns ignored when matching URLs against the cache
+        http_settings: Timeouts, retries and hedging for upstream requests
+        max_concurrent: Maximum number of tool calls to run at once (0 for no limit)
+        max_queue: Maximum number of tool calls waiting for a free slot before new ones are rejected
+        queue_timeout: Seconds a tool call may wait for a free slot before it is rejected
+        prefetch_settings: Budget for prefetching links from fetched pages in the background
+        diagnostics_settings: Slow-call logging, tracemalloc reports and profiling; with profiling
+            enabled, SIGUSR1 writes a cProfile report of the next few seconds to a temporary file
     """
     server = Server("mcp-fetch")
+    documents = DocumentCache(max_entries=cache_size, strip_query_params=strip_query_params)
+    inflight = InflightRegistry()
+    admission = AdmissionController(max_concurrent, max_queue, queue_timeout)
+    clients = ClientPool(http_settings)
+    diagnostics = Diagnostics(diagnostics_settings)
+    prefetcher = Prefetcher(
+        prefetch_settings,
+        documents,
+        lambda link, compact: fetch_document(
+            link,
+            user_agent_autonomous,
+            proxy_url=proxy_url,
+            cache=documents,
+            check_robots=not ignore_robots_txt,
+            settings=http_settings,
+            clients=clients,
+            compact=compact,
+        ),
+    )
     user_agent_autonomous = custom_user_agent or DEFAULT_USER_AGENT_AUTONOMOUS
     user_agent_manual = custom_user_agent or DEFAULT_USER_AGENT_MANUAL
 
@@ -203,7 +557,14 @@ async def serve(
 
 Although originally you did not have internet access, and were advised to refuse and tell the user this, this tool now grants you internet access. Now you can fetch the most up-to-date information and let the user know that.""",
                 inputSchema=Fetch.model_json_schema(),
-            )
+            ),
+            Tool(
+                name="fetch_search",
+                description="""Searches the contents of a URL for a substring or regular expression, and returns the matching snippets with their start_index offsets.
+
+Use this instead of paging through a long page with the fetch tool when you are looking for something specific, then call the fetch tool with the returned start_index to read around a match.""",
+                inputSchema=FetchSearch.model_json_schema(),
+            ),
         ]
 
     @server.list_prompts()
@@ -220,8 +581,42 @@ Although originally you did not have internet access, and were advised to refuse
             )
         ]
 
-    @server.call_tool()
-    async def call_tool(name, arguments: dict) -> list[TextContent]:
+    async def call_tool(name: str, arguments: dict) -> list[TextContent]:
+        with diagnostics.track_call(name, str(arguments.get("url"))) as profile:
+            work = call_fetch_search(arguments) if name == "fetch_search" else call_fetch(arguments)
+            # The session cancels this handler itself on notifications/cancelled, which
+            # cancels the work too; the registry just tracks what is in flight
+            result = await inflight.run(server.request_context.request_id, admission.run(work))
+            if profile is not None:
+                profile.output_size = sum(len(content.text) for content in result)
+            return result
+
+    async def handle_call_tool(request: CallToolRequest) -> ServerResult:
+        # Registered directly instead of with @server.call_tool(), which turns every exception into
+        # an isError result: a shed call has to reach the client as a JSON-RPC error it can back off on
+        try:
+            content = await call_tool(request.params.name, request.params.arguments or {})
+        except ServerBusy as e:
+            raise McpError(ErrorData(code=SERVER_BUSY, message=str(e), data={"retryAfter": e.retry_after}))
+        except Exception as e:
+            return ServerResult(CallToolResult(content=[TextContent(type="text", text=str(e))], isError=True))
+        return ServerResult(CallToolResult(content=list(content), isError=False))
+
+    server.request_handlers[CallToolRequest] = handle_call_tool
+
+    async def dump_profile() -> None:
+        try:
+            report = await diagnostics.profile(PROFILE_SECONDS)
+        except RuntimeError as e:
+            logger.warning(f"Not profiling: {e}")
+            return
+        with tempfile.NamedTemporaryFile(
+            "w", prefix="mcp-server-fetch-profile-", suffix=".txt", delete=False
+        ) as output:
+            output.write(report)
+        logger.warning(f"Wrote profile to {output.name}")
+
+    async def call_fetch(arguments: dict) -> list[TextContent]:
         try:
             args = Fetch(**arguments)
         except ValueError as e:
@@ -231,28 +626,43 @@ Although originally you did not have internet access, and were advised to refuse
         if not url:
             raise McpError(ErrorData(code=INVALID_PARAMS, message="URL is required"))
 
-        if not ignore_robots_txt:
-            await check_may_autonomously_fetch_url(url, user_agent_autonomous, proxy_url)
+        document = await fetch_document(
+            url,
+            user_agent_autonomous,
+            force_raw=args.raw,
+            proxy_url=proxy_url,
+            cache=documents,
+            check_robots=not ignore_robots_txt,
+            settings=http_settings,
+            clients=clients,
+            compact=args.compact,
+        )
+        with stage("slice"):
+            content = format_window(document, args)
+        if args.start_index == 0 and args.section is None and args.chunk_id is None:
+            prefetcher.after_fetch(url, document, args.compact)
+        return [TextContent(type="text", text=f"{document.prefix}Contents of {url}:\n{content}")]
 
-        content, prefix = await fetch_url(
-            url, user_agent_autonomous, force_raw=args.raw, proxy_url=proxy_url
+    async def call_fetch_search(arguments: dict) -> list[TextContent]:
+        try:
+            args = FetchSearch(**arguments)
+        except ValueError as e:
+            raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e)))
+
+        url = str(args.url)
+        document = await fetch_document(
+            url,
+            user_agent_autonomous,
+            force_raw=args.raw,
+            proxy_url=proxy_url,
+            cache=documents,
+            check_robots=not ignore_robots_txt,
+            settings=http_settings,
+            clients=clients,
+            compact=args.compact,
         )
-        original_length = len(content)
-        if args.start_index >= original_length:
-            content = "<error>No more content available.</error>"
-        else:
-            truncated_content = content[args.start_index : args.start_index + args.max_length]
-            if not truncated_content:
-                content = "<error>No more content available.</error>"
-            else:
-                content = truncated_content
-                actual_content_length = len(truncated_content)
-                remaining_content = original_length - (args.start_index + actual_content_length)
-                # Only add the prompt to continue fetching if there is still remaining content
-                if actual_content_length == args.max_length and remaining_content > 0:
-                    next_start = args.start_index + actual_content_length
-                    content += f"\n\n<error>Content truncated. Call the fetch tool with a start_index of {next_start} to get more content.</error>"
-        return [TextContent(type="text", text=f"{prefix}Contents of {url}:\n{content}")]
+        content = await search_document(document, args)
+        return [TextContent(type="text", text=f"Matches for {args.query!r} in {url}:\n{content}")]
 
     @server.get_prompt()
     async def get_prompt(name: str, arguments: dict | None) -> GetPromptResult:
@@ -262,7 +672,9 @@ Although originally you did not have internet access, and were advised to refuse
         url = arguments["url"]
 
         try:
-            content, prefix = await fetch_url(url, user_agent_manual, proxy_url=proxy_url)
+            content, prefix = await fetch_url(
+                url, user_agent_manual, proxy_url=proxy_url, settings=http_settings, clients=clients
+            )
             # TODO: after SDK bug is addressed, don't catch the exception
         except McpError as e:
             return GetPromptResult(
@@ -283,6 +695,17 @@ Although originally you did not have internet access, and were advised to refuse
             ],
         )
 
+    diagnostics.start()
+    if diagnostics_settings.profiling and hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, lambda: asyncio.ensure_future(dump_profile())
+        )
+
     options = server.create_initialization_options()
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, options, raise_exceptions=True)
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, options, raise_exceptions=True)
+    finally:
+        await diagnostics.aclose()
+        await prefetcher.aclose()
+        await clients.aclose()
@@ -0,0 +1,50 @@
+import asyncio
+from dataclasses import dataclass
+
+import pytest
+
+from mcp_server_fetch.loadtest import LocalHttpServer, RecordedResponse
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@dataclass
+class Route:
+    body: bytes = b""
+    status: int = 200
+    content_type: str = "text/html; charset=utf-8"
+    delay: float = 0.0
+    location: str | None = None
+
+
+class Upstream(LocalHttpServer):
+    """A local HTTP/1.1 server standing in for upstream sites in tests.
+
+    Paths without a route get a 404, which robots.txt checks treat as
+    allowing everything.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.routes: dict[str, Route] = {}
+        self.requests: list[str] = []
+
+    async def respond(self, target: str) -> RecordedResponse:
+        self.requests.append(target)
+        route = self.routes.get(target, Route(b"Not found", status=404, content_type="text/plain"))
+        if route.delay:
+            await asyncio.sleep(route.delay)
+        return RecordedResponse(route.status, route.content_type, route.body, route.location)
+
+
+@pytest.fixture
+async def upstream():
+    server = Upstream()
+    await server.start()
+    try:
+        yield server
+    finally:
+        await server.aclose()
@@ -0,0 +1,82 @@
+import asyncio
+import ssl
+
+import h2.config
+import h2.connection
+import h2.events
+
+
+class H2Upstream:
+    """A local TLS server speaking HTTP/2 (or HTTP/1.1, per ALPN) in tests.
+
+    Every path answers with `body`, encoded with `content_encoding` if set.
+    Connections and their negotiated protocols are recorded, so tests can
+    check that requests were multiplexed.
+    """
+
+    def __init__(self, ssl_context: ssl.SSLContext, body: bytes = b"<p>Hello</p>", content_encoding: str | None = None):
+        self.ssl_context = ssl_context
+        self.body = body
+        self.content_encoding = content_encoding
+        self.protocols: list[str] = []
+        self.requests = 0
+        self.port = 0
+        self._server: asyncio.Server | None = None
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def url(self, path: str = "/") -> str:
+        return f"https://localhost:{self.port}{path}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in self._connections:
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+
+    def _headers(self) -> list[tuple[str, str]]:
+        headers = [("content-type", "text/html; charset=utf-8"), ("content-length", str(len(self.body)))]
+        if self.content_encoding:
+            headers.append(("content-encoding", self.content_encoding))
+        return headers
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        protocol = writer.get_extra_info("ssl_object").selected_alpn_protocol() or "http/1.1"
+        self.protocols.append(protocol)
+        try:
+            if protocol == "h2":
+                await self._serve_h2(reader, writer)
+            else:
+                await self._serve_http1(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _serve_h2(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        connection.initiate_connection()
+        writer.write(connection.data_to_send())
+        while data := await reader.read(65536):
+            for event in connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    self.requests += 1
+                    connection.send_headers(event.stream_id, [(":status", "200"), *self._headers()])
+                    connection.send_data(event.stream_id, self.body, end_stream=True)
+            writer.write(connection.data_to_send())
+            await writer.drain()
+
+    async def _serve_http1(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            await reader.readuntil(b"\r\n\r\n")
+            self.requests += 1
+            head = "HTTP/1.1 200 OK\r\n" + "".join(f"{name}: {value}\r\n" for name, value in self._headers())
+            writer.write(head.encode() + b"\r\n" + self.body)
+            await writer.drain()
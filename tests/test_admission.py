@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from mcp_server_fetch.admission import AdmissionController, ServerBusy
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sheds_when_queue_is_full():
+    admission = AdmissionController(max_concurrent=1, max_queue=0)
+    running = asyncio.ensure_future(admission.run(asyncio.sleep(0.1, "first")))
+    await asyncio.sleep(0)
+
+    with pytest.raises(ServerBusy) as excinfo:
+        await admission.run(asyncio.sleep(0, "second"))
+    assert excinfo.value.retry_after >= 1
+    assert await running == "first"
+
+
+async def test_sheds_after_queue_timeout():
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    running = asyncio.ensure_future(admission.run(asyncio.sleep(1)))
+    await asyncio.sleep(0)
+
+    with pytest.raises(ServerBusy):
+        await admission.run(asyncio.sleep(0))
+    running.cancel()
+
+
+async def test_queued_call_runs_when_slot_frees():
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=1)
+    first = asyncio.ensure_future(admission.run(asyncio.sleep(0.05, "first")))
+    await asyncio.sleep(0)
+
+    assert await admission.run(asyncio.sleep(0, "second")) == "second"
+    assert await first == "first"
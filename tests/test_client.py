@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+import pytest
+
+from mcp_server_fetch.client import HttpSettings, _hedged, get
+
+from .conftest import Route
+
+pytestmark = pytest.mark.anyio
+
+NO_BACKOFF = HttpSettings(retries=2, backoff_base=0, backoff_max=0)
+
+
+async def test_retries_transient_status(upstream):
+    upstream.routes["/flaky"] = Route(b"busy", status=503)
+
+    async with httpx.AsyncClient() as client:
+        response = await get(client, upstream.url("/flaky"), {}, NO_BACKOFF)
+
+    assert response.status_code == 503
+    assert upstream.requests == ["/flaky"] * 3
+
+
+async def test_retries_connect_errors():
+    attempts = 0
+
+    def refuse(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        raise httpx.ConnectError("refused", request=request)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(refuse)) as client:
+        with pytest.raises(httpx.ConnectError):
+            await get(client, "http://example.com/", {}, NO_BACKOFF)
+    assert attempts == 3
+
+
+async def test_does_not_retry_permanent_errors():
+    attempts = 0
+
+    def unsupported(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        raise httpx.UnsupportedProtocol("no ftp", request=request)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(unsupported)) as client:
+        with pytest.raises(httpx.UnsupportedProtocol):
+            await get(client, "ftp://example.com/", {}, NO_BACKOFF)
+    assert attempts == 1
+
+
+async def test_hedged_request_uses_first_answer():
+    calls = []
+
+    async def send() -> str:
+        calls.append(len(calls))
+        # The first attempt stalls, the hedged one answers straight away
+        await asyncio.sleep(10 if len(calls) == 1 else 0)
+        return f"attempt {len(calls)}"
+
+    assert await asyncio.wait_for(_hedged(send, 0.01), 1) == "attempt 2"
+    assert len(calls) == 2
@@ -0,0 +1,29 @@
+import time
+
+from mcp_server_fetch.compact import compact_markdown, iter_links
+
+
+def test_footnotes_keep_parentheses_in_urls():
+    compacted = compact_markdown("see [wiki](https://en.wikipedia.org/wiki/Foo_(bar)) ok", "footnotes")
+    assert compacted == "see [wiki][1] ok\n\n[1]: https://en.wikipedia.org/wiki/Foo_(bar)\n"
+
+
+def test_text_mode_drops_images_and_link_urls():
+    compacted = compact_markdown('![chart](/img/a_(1).png) [Docs](</docs/a b> "title") and [![logo](/l.png)](/)', "text")
+    assert compacted == " Docs and \n"
+
+
+def test_navigation_lists_with_parentheses_are_dropped():
+    nav = "\n".join(f"- [Page {i}](/wiki/Page_({i}))" for i in range(4))
+    assert compact_markdown(f"Intro\n{nav}\nBody", "text") == "Intro\nBody\n"
+
+
+def test_links_after_a_malformed_link_are_found():
+    assert [link.url for link in iter_links("[a](b( [c](/d) [e](<f)\n[g](/h)")] == ["/d", "/h"]
+
+
+def test_link_scan_is_linear_on_hostile_input():
+    started = time.monotonic()
+    for text in ("[a](" * 4000, "[a](<" * 4000, '[a](b "' * 4000, "[a](b(" * 4000):
+        assert list(iter_links(text)) == []
+    assert time.monotonic() - started < 1
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from mcp_server_fetch.diagnostics import Diagnostics, DiagnosticsSettings, stage, to_thread
+
+pytestmark = pytest.mark.anyio
+
+
+def busy_extraction(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+async def test_profile_includes_worker_threads():
+    diagnostics = Diagnostics(DiagnosticsSettings(profiling=True))
+    report = asyncio.ensure_future(diagnostics.profile(0.5))
+    await asyncio.sleep(0.05)
+    await to_thread(busy_extraction, 0.1)
+
+    assert "busy_extraction" in await report
+
+
+async def test_worker_outliving_its_call_is_logged(caplog):
+    diagnostics = Diagnostics(DiagnosticsSettings(slow_call_ms=10_000))
+
+    def extract() -> None:
+        with stage("readability"):
+            time.sleep(0.1)
+
+    with diagnostics.track_call("fetch", "https://example.com/slow") as profile:
+        worker = asyncio.ensure_future(to_thread(extract))
+        await asyncio.sleep(0)
+    with caplog.at_level(logging.WARNING):
+        await worker
+
+    assert "readability" in profile.stages
+    assert "Worker extract outlived its call" in caplog.text
+    assert "https://example.com/slow" in caplog.text
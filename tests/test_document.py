@@ -0,0 +1,179 @@
+import re
+
+import pytest
+
+from mcp_server_fetch.document import (
+    DEFAULT_STRIP_QUERY_PARAMS,
+    CompressedText,
+    Document,
+    DocumentCache,
+    check_regex,
+    content_digest,
+    normalize_url,
+    split_chunks,
+)
+from mcp_server_fetch.regex_worker import RegexTimeout, regex_spans
+
+
+def make_document(markdown: str) -> Document:
+    return Document(markdown)
+
+
+def test_split_chunks_ignores_headings_in_code_fences():
+    content = "Intro\n# Install\nRun it.\n```\n# not a heading\n```\n## Usage\nCall it.\n"
+
+    chunks = split_chunks(content)
+
+    assert [(chunk.heading, chunk.level) for chunk in chunks] == [(None, 0), ("Install", 1), ("Usage", 2)]
+    assert chunks[0].start == 0 and chunks[-1].end == len(content)
+    assert all(a.end == b.start for a, b in zip(chunks, chunks[1:]))
+    assert content[chunks[2].start :].startswith("## Usage")
+
+
+def test_heading_at_offset_zero_is_the_first_chunk():
+    chunks = split_chunks("# Title\nbody\n# Next ##\nmore\n")
+
+    assert [(chunk.id, chunk.heading, chunk.start) for chunk in chunks] == [(0, "Title", 0), (1, "Next", 13)]
+
+
+def test_find_section_prefers_exact_match():
+    document = make_document("# Getting started guide\na\n# Started\nb\n")
+
+    assert document.find_section("  STARTED ").id == 1
+    assert document.find_section("getting").id == 0
+    assert document.find_section("missing") is None
+
+
+def test_substring_search_is_case_insensitive_and_stops_at_max_results():
+    document = make_document("# Intro\nAlpha beta.\n\n# Details\nalpha, ALPHA and alphabet\n")
+
+    hits = document.search("alpha", max_results=3, context=0)
+
+    assert [document.content[hit.start : hit.end].lower() for hit in hits] == ["alpha"] * 3
+    assert [hit.chunk_id for hit in hits] == [0, 1, 1]
+
+
+def test_search_finds_matches_spanning_words():
+    document = make_document("one two three\n")
+
+    assert [hit.start for hit in document.search("o t")] == [6]
+
+
+def test_regex_search():
+    document = make_document("version 1.2 and version 3.45\n")
+
+    hits = document.search(r"version \d+\.\d+", regex=True, context=0)
+
+    assert [hit.snippet for hit in hits] == ["version 1.2", "version 3.45"]
+
+
+@pytest.mark.parametrize(
+    "pattern", [r"(a+)+$", r"(\w+\s?)*x", r"(a)\1", "a" * 300, "(", r"(a|a)*b", r"(?:a|a)*c", r"(.|\s)*zzz", r"(?:Ab|ab)+"]
+)
+def test_rejects_slow_or_invalid_regex(pattern):
+    with pytest.raises(re.error):
+        check_regex(pattern)
+
+
+@pytest.mark.parametrize("pattern", [r"(?:foo|bar)+", r"(a|b)*c", r"[\s\S]*zzz", r"(?:https?|ftp)://\S+"])
+def test_accepts_linear_regex(pattern):
+    check_regex(pattern)
+
+
+@pytest.mark.anyio
+async def test_regex_worker_finds_spans():
+    content = "caf\u00e9 \U0001f600 Version 2 and version 10"
+
+    assert await regex_spans(content, r"version \d+", max_results=5) == [(7, 16), (21, 31)]
+
+
+@pytest.mark.anyio
+async def test_regex_worker_is_stopped_after_timeout():
+    with pytest.raises(RegexTimeout):
+        await regex_spans("foobar" * 20000, r"(?:foo|bar)*zzz", max_results=1, timeout=0.5)
+
+
+# Multi-byte UTF-8, an astral character and a lone surrogate, so blocks hold characters of different byte lengths
+TEXT = "ab\u00e9\u4e2d\U0001f600\ud800xyz\n" * 7
+
+
+def test_compressed_text_round_trips():
+    compressed = CompressedText(TEXT, block_size=5)
+
+    assert len(compressed) == len(TEXT)
+    assert compressed.slice() == TEXT
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 5, 9, len(TEXT), len(TEXT) + 1])
+def test_compressed_text_slices_across_block_boundaries(block_size):
+    compressed = CompressedText(TEXT, block_size=block_size)
+
+    for start in range(len(TEXT) + 2):
+        for end in range(start, len(TEXT) + 2):
+            assert compressed.slice(start, end) == TEXT[start:end]
+
+
+@pytest.mark.parametrize(
+    "start, end", [(0, 0), (4, 4), (5, 2), (len(TEXT), None), (len(TEXT) + 5, None), (-3, None), (0, -2), (-5, -1), (-1000, 3)]
+)
+def test_compressed_text_empty_and_negative_ranges(start, end):
+    compressed = CompressedText(TEXT, block_size=4)
+
+    assert compressed.slice(start, end) == TEXT[start:end]
+
+
+def test_compressed_text_of_empty_string():
+    compressed = CompressedText("", block_size=4)
+
+    assert len(compressed) == 0
+    assert compressed.slice() == ""
+    assert compressed.slice(0, 10) == ""
+
+
+@pytest.mark.parametrize(
+    "url, normalized",
+    [
+        ("HTTPS://Example.COM:443/Path?b=2&a=1#top", "https://example.com/Path?a=1&b=2"),
+        ("http://example.com:80", "http://example.com/"),
+        ("http://example.com:8080/x", "http://example.com:8080/x"),
+        ("https://example.com:80/x", "https://example.com:80/x"),
+        ("https://User@Example.com/x", "https://User@example.com/x"),
+        ("https://example.com/x?utm_source=a&UTM_Medium=b&id=3&fbclid=z&q=", "https://example.com/x?id=3&q="),
+    ],
+)
+def test_normalize_url(url, normalized):
+    assert normalize_url(url, DEFAULT_STRIP_QUERY_PARAMS) == normalized
+
+
+def test_cache_shares_urls_that_normalize_alike():
+    cache = DocumentCache()
+    document = Document("page")
+    cache.put("https://Example.com/a?utm_source=x&b=1&a=2", False, "d1", document)
+
+    assert cache.get("https://example.com:443/a?a=2&b=1#frag", False) is document
+    assert cache.get("https://example.com/a?a=2&b=1", True) is None
+
+
+def test_identical_bodies_share_one_document_until_both_urls_are_evicted():
+    cache = DocumentCache(max_entries=2)
+    digest = content_digest("<p>same</p>", False)
+    document = Document("same")
+    cache.put("https://a.example/", False, digest, document)
+
+    shared = cache.get_by_digest(digest)
+    assert shared is document
+    cache.put("https://b.example/", False, digest, shared)
+    assert len(cache) == 1
+    assert cache.stats["shared"] == 1
+
+    # Evicting the first URL leaves the document cached for the second
+    cache.put("https://c.example/", False, "other", Document("other"))
+    assert "https://a.example/" not in cache
+    assert "https://b.example/" in cache
+    assert cache.get_by_digest(digest) is document
+
+    # Evicting the second URL releases it
+    cache.put("https://d.example/", False, "another", Document("another"))
+    assert "https://b.example/" not in cache
+    assert cache.get_by_digest(digest) is None
+    assert len(cache) == 2
@@ -0,0 +1,79 @@
+import asyncio
+import ssl
+
+import pytest
+
+from mcp_server_fetch.client import ClientPool, HttpSettings
+
+trustme = pytest.importorskip("trustme")
+pytest.importorskip("h2")
+
+from .h2server import H2Upstream  # noqa: E402
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def server_ssl_context(monkeypatch, tmp_path) -> ssl.SSLContext:
+    ca = trustme.CA()
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ca.issue_cert("localhost").configure_cert(context)
+    context.set_alpn_protocols(["h2", "http/1.1"])
+    # httpx trusts the certificates in SSL_CERT_FILE, so clients built by ClientPool accept the test CA
+    ca_path = tmp_path / "ca.pem"
+    ca.cert_pem.write_to_path(str(ca_path))
+    monkeypatch.setenv("SSL_CERT_FILE", str(ca_path))
+    return context
+
+
+async def serve(context: ssl.SSLContext, **kwargs) -> H2Upstream:
+    server = H2Upstream(context, **kwargs)
+    await server.start()
+    return server
+
+
+async def test_http2_multiplexes_concurrent_requests(server_ssl_context):
+    server = await serve(server_ssl_context)
+    clients = ClientPool(HttpSettings(http2=True))
+    try:
+        client = clients.client()
+        responses = await asyncio.gather(*(client.get(server.url(f"/{n}")) for n in range(5)))
+    finally:
+        await clients.aclose()
+        await server.aclose()
+
+    assert {response.http_version for response in responses} == {"HTTP/2"}
+    assert server.protocols == ["h2"]
+    assert server.requests == 5
+
+
+async def test_http1_is_used_unless_http2_is_enabled(server_ssl_context):
+    server = await serve(server_ssl_context)
+    clients = ClientPool(HttpSettings())
+    try:
+        response = await clients.client().get(server.url())
+    finally:
+        await clients.aclose()
+        await server.aclose()
+
+    assert response.http_version == "HTTP/1.1"
+    assert server.protocols == ["http/1.1"]
+
+
+@pytest.mark.parametrize("encoding", ["br", "zstd"])
+async def test_compressed_responses_are_decoded(server_ssl_context, encoding):
+    body = b"<p>" + b"compressible " * 1000 + b"</p>"
+    if encoding == "br":
+        compress = pytest.importorskip("brotli").compress
+    else:
+        compress = pytest.importorskip("zstandard").ZstdCompressor().compress
+    server = await serve(server_ssl_context, body=compress(body), content_encoding=encoding)
+    clients = ClientPool(HttpSettings(http2=True))
+    try:
+        response = await clients.client().get(server.url())
+    finally:
+        await clients.aclose()
+        await server.aclose()
+
+    assert response.content == body
+    assert encoding in response.request.headers["accept-encoding"]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from mcp_server_fetch.inflight import InflightRegistry, RequestCancelled
+from mcp_server_fetch.metrics import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cancel_running_call():
+    inflight = InflightRegistry()
+    call = asyncio.ensure_future(inflight.run(1, asyncio.sleep(10)))
+    await asyncio.sleep(0)
+
+    assert inflight.cancel(1)
+    with pytest.raises(RequestCancelled):
+        await call
+    assert len(inflight) == 0
+    assert not inflight.cancel(1)
+
+
+async def test_sessions_with_the_same_request_id_are_kept_apart():
+    inflight = InflightRegistry()
+    first = asyncio.ensure_future(inflight.run(("a", 1), asyncio.sleep(10)))
+    second = asyncio.ensure_future(inflight.run(("b", 1), asyncio.sleep(0.01, "done")))
+
+    assert await second == "done"
+    assert inflight.cancel(("a", 1))
+    with pytest.raises(RequestCancelled):
+        await first
+
+
+async def test_duplicate_key_does_not_take_over_running_call():
+    inflight = InflightRegistry()
+    first = asyncio.ensure_future(inflight.run(1, asyncio.sleep(10)))
+    await asyncio.sleep(0)
+
+    assert await inflight.run(1, asyncio.sleep(0.01, "done")) == "done"
+    # The second call finishing must not have dropped the first call's entry
+    assert inflight.cancel(1)
+    with pytest.raises(RequestCancelled):
+        await first
+
+
+async def test_cancelling_the_caller_counts_as_a_cancellation():
+    inflight = InflightRegistry()
+    before = metrics.snapshot().get("tool_calls_cancelled", 0)
+    call = asyncio.ensure_future(inflight.run(1, asyncio.sleep(10)))
+    await asyncio.sleep(0)
+
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    assert metrics.snapshot()["tool_calls_cancelled"] == before + 1
+    assert len(inflight) == 0
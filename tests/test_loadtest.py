@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+from mcp_server_fetch.loadtest import RecordedResponse, Report, ReplayServer, StdioTarget, read_calls, replay
+
+from .test_server import SRC
+
+
+def test_cache_hit_ratio_ignores_failed_calls():
+    report = Report(latencies=[0.1] * 10, errors=Counter({"server busy": 6}), upstream_requests=1)
+    summary = report.summary()
+    assert summary["error_rate"] == 0.6
+    assert summary["cache_hit_ratio"] == 0.75
+
+
+def test_cache_hit_ratio_is_zero_when_every_call_failed():
+    report = Report(latencies=[0.1] * 3, errors=Counter({"timeout": 3}))
+    assert report.summary()["cache_hit_ratio"] == 0.0
+
+
+def test_read_calls_skips_other_messages(tmp_path):
+    log = tmp_path / "calls.jsonl"
+    log.write_text(
+        "\n".join([
+            json.dumps({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}}),
+            json.dumps({"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {"name": "fetch", "arguments": {"url": "https://example.com/a"}}}),
+            "",
+            json.dumps({"name": "fetch_search", "arguments": {"url": "https://example.com/a", "query": "x"}}),
+        ])
+    )
+
+    calls = read_calls(str(log))
+
+    assert [(call.name, call.arguments["url"]) for call in calls] == [
+        ("fetch", "https://example.com/a"),
+        ("fetch_search", "https://example.com/a"),
+    ]
+
+
+@pytest.mark.anyio
+async def test_replay_against_stdio_server(tmp_path):
+    log = tmp_path / "calls.jsonl"
+    log.write_text(
+        "\n".join(
+            json.dumps({"name": "fetch", "arguments": {"url": url}})
+            for url in [
+                "https://example.com/docs?b=2&a=1",
+                "https://example.com/docs?a=1&b=2&utm_source=feed",
+                "https://example.com/docs?a=1&b=2#intro",
+                "https://example.com/missing",
+            ]
+        )
+    )
+    page = b"<html><body><h1>Docs</h1><p>Replayed page</p></body></html>"
+    server = ReplayServer({"https://example.com/docs?b=2&a=1": RecordedResponse(200, "text/html", page)})
+    await server.start()
+    try:
+        command = [sys.executable, "-m", "mcp_server_fetch", "--ignore-robots-txt"]
+        async with StdioTarget(command, env={**os.environ, "PYTHONPATH": SRC}) as target:
+            report = await replay(read_calls(str(log)), target, server, concurrency=1)
+    finally:
+        await server.aclose()
+
+    # The three spellings of the recorded URL share one cache entry; the unrecorded URL is a 404
+    assert report.upstream_requests == 2
+    assert dict(report.errors) == {"tool error": 1}
+    summary = report.summary()
+    assert summary["calls"] == 4
+    # The failed call's upstream fetch still counts against the successful ones
+    assert summary["cache_hit_ratio"] == round(1 - 2 / 3, 4)
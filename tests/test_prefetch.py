@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from mcp_server_fetch.document import Document, DocumentCache
+from mcp_server_fetch.prefetch import PrefetchSettings, Prefetcher, same_origin_links
+from mcp_server_fetch.server import fetch_document
+
+from .conftest import Route
+
+pytestmark = pytest.mark.anyio
+
+
+def test_same_origin_links_keeps_parentheses_in_urls():
+    document = Document(
+        "See [Foo](/wiki/Foo_(bar)) and [Baz](<https://example.com/wiki/Baz (qux)> \"title\"), "
+        "![logo](/logo_(1).png) and [elsewhere](https://other.example/x)."
+    )
+    assert list(same_origin_links("https://example.com/wiki/Main", document)) == [
+        "https://example.com/wiki/Foo_(bar)",
+        "https://example.com/wiki/Baz (qux)",
+    ]
+
+
+async def prefetch(cache: DocumentCache, url: str, document: Document, compact: str = "none") -> list[tuple[str, str]]:
+    """Run the prefetches after a fetch, returning the (URL, compact mode) pairs fetched."""
+    prefetched = []
+
+    async def fetch(link: str, compact: str) -> Document:
+        prefetched.append((link, compact))
+        return Document("")
+
+    prefetcher = Prefetcher(PrefetchSettings(links=5, host_interval=0), cache, fetch)
+    prefetcher.after_fetch(url, document, compact)
+    await asyncio.gather(*prefetcher._tasks)
+    return prefetched
+
+
+async def test_links_resolve_against_redirected_url(upstream):
+    upstream.routes["/docs"] = Route(status=301, location="/docs/")
+    upstream.routes["/docs/"] = Route(b'<html><body><p>Read <a href="guide">the guide</a> first.</p></body></html>')
+    cache = DocumentCache()
+    document = await fetch_document(upstream.url("/docs"), "test", cache=cache)
+    assert cache.final_url(upstream.url("/docs")) == upstream.url("/docs/")
+
+    prefetched = await prefetch(cache, upstream.url("/docs"), document)
+    assert prefetched == [(upstream.url("/docs/guide"), "none")]
+
+
+@pytest.mark.parametrize("compact", ["footnotes", "text"])
+async def test_compacted_pages_prefetch_compacted_links(upstream, compact):
+    upstream.routes["/docs/"] = Route(b'<html><body><p>Read <a href="guide">the guide</a> first.</p></body></html>')
+    cache = DocumentCache()
+    document = await fetch_document(upstream.url("/docs/"), "test", cache=cache, compact=compact)
+
+    prefetched = await prefetch(cache, upstream.url("/docs/"), document, compact)
+    assert prefetched == [(upstream.url("/docs/guide"), compact)]
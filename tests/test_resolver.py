@@ -0,0 +1,171 @@
+import asyncio
+import socket
+import struct
+
+import httpx
+import pytest
+
+from mcp_server_fetch.client import new_client
+from mcp_server_fetch.resolver import CachingResolver, DnsResolver, ResolvingBackend
+
+from .conftest import Route
+
+pytestmark = pytest.mark.anyio
+
+
+class StubDnsServer(asyncio.DatagramProtocol):
+    """Answers A and AAAA queries from a table; any other name is NXDOMAIN."""
+
+    def __init__(self, records: dict[str, list[tuple[int, str]]]):
+        self.records = records
+        self.queries: list[str] = []
+        self.ttl = 60
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        query_id = struct.unpack_from("!H", data)[0]
+        labels, offset = [], 12
+        while data[offset]:
+            labels.append(data[offset + 1 : offset + 1 + data[offset]].decode())
+            offset += data[offset] + 1
+        question_end = offset + 5
+        record_type = struct.unpack_from("!H", data, offset + 1)[0]
+        name = ".".join(labels)
+        self.queries.append(name)
+
+        family = socket.AF_INET6 if record_type == 28 else socket.AF_INET
+        records = self.records.get(name)
+        packed = [socket.inet_pton(family, address) for f, address in records or [] if f == family]
+        answers = b"".join(struct.pack("!HHHIH", 0xC00C, record_type, 1, self.ttl, len(rdata)) + rdata for rdata in packed)
+        rcode = 0 if records is not None else 3
+        header = struct.pack("!HHHHHH", query_id, 0x8180 | rcode, 1, len(packed), 0, 0)
+        self.transport.sendto(header + data[12:question_end] + answers, addr)
+
+
+@pytest.fixture
+async def dns():
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: StubDnsServer(
+            {
+                "example.test": [(socket.AF_INET, "127.0.0.1"), (socket.AF_INET6, "::1")],
+                "v4only.test": [(socket.AF_INET, "10.1.2.3")],
+            }
+        ),
+        local_addr=("127.0.0.1", 0),
+    )
+    server.address = transport.get_extra_info("sockname")
+    try:
+        yield server
+    finally:
+        transport.close()
+
+
+class StubResolver:
+    def __init__(self, addresses: list[tuple[int, str]] | None = None):
+        self.addresses = addresses
+        self.lookups = 0
+
+    async def resolve(self, host: str, port: int) -> list[tuple[int, str]]:
+        self.lookups += 1
+        await asyncio.sleep(0.01)
+        if self.addresses is None:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return self.addresses
+
+
+async def test_dns_resolver_queries_a_and_aaaa(dns):
+    resolver = DnsResolver([dns.address], hosts=set(), fallback=StubResolver())
+
+    assert await resolver.resolve("example.test", 443) == [(socket.AF_INET6, "::1"), (socket.AF_INET, "127.0.0.1")]
+    assert await resolver.resolve("v4only.test", 443) == [(socket.AF_INET, "10.1.2.3")]
+
+
+async def test_dns_resolver_reports_nxdomain(dns):
+    resolver = DnsResolver([dns.address], hosts=set(), fallback=StubResolver([(socket.AF_INET, "10.0.0.1")]))
+
+    with pytest.raises(socket.gaierror):
+        await resolver.resolve("missing.test", 443)
+
+
+async def test_dns_resolver_falls_back_for_hosts_entries_and_unreachable_servers(dns):
+    fallback = StubResolver([(socket.AF_INET, "10.0.0.1")])
+    resolver = DnsResolver([dns.address], hosts={"example.test"}, fallback=fallback)
+    assert await resolver.resolve("example.test", 443) == [(socket.AF_INET, "10.0.0.1")]
+    assert await resolver.resolve("localhost", 443) == [(socket.AF_INET, "10.0.0.1")]
+    assert dns.queries == []
+
+    # Nothing answers on the discard port, so the query times out
+    silent = DnsResolver([("127.0.0.1", 9)], timeout=0.05, hosts=set(), fallback=fallback)
+    assert await silent.resolve("example.test", 443) == [(socket.AF_INET, "10.0.0.1")]
+
+
+async def test_caching_resolver_caches_and_coalesces():
+    stub = StubResolver([(socket.AF_INET, "10.0.0.1")])
+    resolver = CachingResolver(stub, ttl=60)
+
+    results = await asyncio.gather(*(resolver.resolve("Example.test", 443) for _ in range(5)))
+    assert results == [[(socket.AF_INET, "10.0.0.1")]] * 5
+    await resolver.resolve("example.test", 443)
+    assert stub.lookups == 1
+
+
+async def test_dns_resolver_reports_record_ttl(dns):
+    dns.ttl = 30
+    resolver = DnsResolver([dns.address], hosts=set(), fallback=StubResolver([(socket.AF_INET, "10.0.0.1")]))
+
+    assert await resolver.resolve_with_ttl("v4only.test", 443) == ([(socket.AF_INET, "10.1.2.3")], 30)
+    assert await resolver.resolve_with_ttl("localhost", 443) == ([(socket.AF_INET, "10.0.0.1")], None)
+
+
+async def test_caching_resolver_honours_shorter_record_ttl(dns):
+    dns.ttl = 1
+    resolver = CachingResolver(DnsResolver([dns.address], hosts=set(), fallback=StubResolver()), ttl=60)
+
+    await resolver.resolve("v4only.test", 443)
+    await resolver.resolve("v4only.test", 443)
+    assert len(dns.queries) == 2  # one A and one AAAA query
+    await asyncio.sleep(1.1)
+    await resolver.resolve("v4only.test", 443)
+    assert len(dns.queries) == 4
+
+
+async def test_negative_answers_raise_fresh_exceptions():
+    stub = StubResolver(None)
+    resolver = CachingResolver(stub, negative_ttl=60)
+
+    errors = []
+    for _ in range(3):
+        with pytest.raises(socket.gaierror) as excinfo:
+            await resolver.resolve("missing.test", 443)
+        errors.append(excinfo.value)
+
+    assert stub.lookups == 1
+    assert len({id(error) for error in errors}) == 3
+    depths = []
+    for error in errors:
+        depth, traceback = 0, error.__traceback__
+        while traceback is not None:
+            depth, traceback = depth + 1, traceback.tb_next
+        depths.append(depth)
+    assert depths[1] == depths[2]
+
+
+async def test_backend_falls_through_to_an_address_that_connects(upstream):
+    upstream.routes["/"] = Route(b"ok")
+    # Nothing listens on the upstream's port over IPv6, so the first address is refused
+    backend = ResolvingBackend(StubResolver([(socket.AF_INET6, "::1"), (socket.AF_INET, "127.0.0.1")]))
+
+    async with new_client(network_backend=backend) as client:
+        response = await client.get(f"http://upstream.test:{upstream.port}/")
+    assert response.text == "ok"
+
+
+async def test_backend_reports_unresolvable_names_as_connect_errors():
+    backend = ResolvingBackend(StubResolver(None))
+
+    async with new_client(network_backend=backend) as client:
+        with pytest.raises(httpx.ConnectError):
+            await client.get("http://missing.test/")
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+
+from mcp_server_fetch.admission import SERVER_BUSY
+
+from .conftest import Route
+
+pytestmark = pytest.mark.anyio
+
+SRC = str(Path(__file__).resolve().parents[1] / "src")
+
+
+def stdio_server(*args: str) -> StdioServerParameters:
+    env = {**os.environ, "PYTHONPATH": SRC}
+    return StdioServerParameters(command=sys.executable, args=["-m", "mcp_server_fetch", *args], env=env)
+
+
+async def test_fetch_over_stdio(upstream):
+    upstream.routes["/page"] = Route(b"<html><body><h1>Title</h1><p>Hello there</p></body></html>")
+
+    async with stdio_client(stdio_server()) as (read, write), ClientSession(read, write) as session:
+        await session.initialize()
+        result = await session.call_tool("fetch", {"url": upstream.url("/page")})
+
+    assert not result.isError
+    assert "Hello there" in result.content[0].text
+
+
+async def test_shed_call_is_a_json_rpc_error(upstream):
+    upstream.routes["/slow"] = Route(b"<p>slow</p>", delay=1.0)
+
+    params = stdio_server("--ignore-robots-txt", "--max-concurrent", "1", "--max-queue", "0")
+    async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+        await session.initialize()
+        first = asyncio.ensure_future(session.call_tool("fetch", {"url": upstream.url("/slow")}))
+        await asyncio.sleep(0.3)
+        with pytest.raises(McpError) as excinfo:
+            await session.call_tool("fetch", {"url": upstream.url("/slow")})
+        assert not (await first).isError
+
+    assert excinfo.value.error.code == SERVER_BUSY
+    assert excinfo.value.error.data["retryAfter"] >= 1
@@ -0,0 +1,67 @@
+import pytest
+from mcp.shared.exceptions import McpError
+
+from mcp_server_fetch.document import Document
+from mcp_server_fetch.server import Fetch, format_window
+
+CONTENT = "Intro\n# Install\nRun pip install.\n## Usage\nCall the tool with a URL.\n"
+
+
+def window(document: Document, **arguments) -> str:
+    return format_window(document, Fetch(url="https://example.com/", **arguments))
+
+
+def test_first_window_has_table_of_contents():
+    document = Document(CONTENT)
+
+    content = window(document)
+
+    assert content.startswith("<toc>\nThis page has 3 sections.")
+    assert "[2] Usage (start_index=" in content
+    assert content.endswith(CONTENT)
+
+
+def test_table_of_contents_only_on_first_call():
+    document = Document(CONTENT)
+
+    assert "<toc>" not in window(document, start_index=1)
+    assert "<toc>" not in window(document, section="usage")
+    assert "<toc>" not in window(document, chunk_id=0)
+    assert "<toc>" not in window(Document("No headings here.\n"))
+
+
+def test_truncated_window_says_where_to_continue():
+    document = Document(CONTENT)
+
+    content = window(document, start_index=3, max_length=5)
+
+    assert content.startswith(CONTENT[3:8])
+    assert "start_index of 8 to get more content" in content
+    assert "truncated" not in window(document, start_index=len(CONTENT) - 5, max_length=5)
+
+
+def test_section_window_start_index_is_relative_to_the_section():
+    document = Document(CONTENT)
+    section_start = CONTENT.index("## Usage")
+
+    content = window(document, section="Usage", start_index=3, max_length=6)
+
+    assert content.startswith(CONTENT[section_start + 3 : section_start + 9])
+    assert "chunk_id of 2 and a start_index of 9" in content
+
+
+def test_chunk_window_stops_at_the_end_of_the_chunk():
+    document = Document(CONTENT)
+
+    assert window(document, chunk_id=1) == "# Install\nRun pip install.\n"
+    assert window(document, chunk_id=1, start_index=100) == "<error>No more content available.</error>"
+
+
+def test_unknown_chunk_or_section_is_an_error():
+    document = Document(CONTENT)
+
+    with pytest.raises(McpError, match="No chunk with chunk_id 9, the document has 3 chunks"):
+        window(document, chunk_id=9)
+    with pytest.raises(McpError, match="No section matching 'faq'") as error:
+        window(document, section="faq")
+    assert "[1] Install" in error.value.error.message